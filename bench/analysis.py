@@ -0,0 +1,127 @@
+"""
+    Measures coverage startup time, and the time taken to analyse every file
+    for a full report, on a generated tree of source files. This is done with
+    no analysis cache, a cold cache and a warm cache. Finally, a recursive run
+    is simulated by reporting on the tree from several directories, first
+    with separate Coverage objects, and then with one Session. Last, file
+    discovery with a long exclude list is compared with checking every file
+    against every entry, as pry used to.
+"""
+import sys, os, time, tempfile, shutil
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import libpry.coverage
+
+FILES = 3000
+
+SOURCE = '''
+class C%(n)s:
+    def method(self, x):
+        if x:
+            return [i*2 for i in range(x)]
+        # begin nocover
+        raise ValueError
+        # end nocover
+
+def func%(n)s(a, b=1):
+    total = 0
+    for i in range(a):
+        total += i*b
+    return total
+'''
+
+
+def makeTree(path):
+    for i in range(FILES):
+        d = os.path.join(path, "pkg%s"%(i/100))
+        if not os.path.isdir(d):
+            os.mkdir(d)
+        open(os.path.join(d, "mod%s.py"%i), "w").write(SOURCE%dict(n=i))
+
+
+def run(path, cacheFile=None):
+    """
+        Returns (startup, report) times, in seconds.
+    """
+    start = time.time()
+    cache = None
+    if cacheFile:
+        cache = libpry.coverage.AnalysisCache(cacheFile)
+    c = libpry.coverage.Coverage(path, cache=cache)
+    startup = time.time() - start
+    c.getGlobalStats()
+    if cache:
+        cache.save()
+    return startup, time.time() - start - startup
+
+
+def runDirs(path, dirs, session=False):
+    """
+        Returns the time taken to set up and report on dirs Coverage objects
+        of the same tree.
+    """
+    start = time.time()
+    s = libpry.coverage.Session()
+    for i in range(dirs):
+        if session:
+            c = s.coverage(path)
+        else:
+            c = libpry.coverage.Coverage(path)
+        c.getGlobalStats()
+    return time.time() - start
+
+
+def naiveFind(path, excludeList):
+    l = []
+    for root, dirs, files in os.walk(path):
+        for f in files:
+            if f.endswith(".py"):
+                p = os.path.join(root, f)
+                if not libpry.utils.isPathContainedAny(excludeList, p):
+                    l.append(p)
+    return l
+
+
+def discover(path, find):
+    """
+        Returns the time taken to find the files of a tree, excluding half
+        of its directories and a few files from each of the others.
+    """
+    excludes = [os.path.join(path, "pkg%s"%i) for i in range(0, 30, 2)]
+    excludes += [os.path.join(path, "*", "mod%s.py"%i) for i in range(40)]
+    if find is naiveFind:
+        # The old exclusion check had no glob support.
+        excludes = excludes[:15] + [
+            os.path.join(path, "pkg%s"%(i/100), "mod%s.py"%i)
+            for i in range(40)
+        ]
+    start = time.time()
+    find(path, excludes)
+    return time.time() - start
+
+
+def main():
+    d = tempfile.mkdtemp()
+    try:
+        tree = os.path.join(d, "tree")
+        os.mkdir(tree)
+        makeTree(tree)
+        cacheFile = os.path.join(d, "cache")
+        print "%s files"%FILES
+        print "            startup  report"
+        print "no cache:   %.3fs   %.3fs"%run(tree)
+        print "cold cache: %.3fs   %.3fs"%run(tree, cacheFile)
+        print "warm cache: %.3fs   %.3fs"%run(tree, cacheFile)
+        print
+        print "5 directories, separate: %.3fs"%runDirs(tree, 5)
+        print "5 directories, session:  %.3fs"%runDirs(tree, 5, True)
+        print
+        print "discovery, naive: %.3fs"%discover(tree, naiveFind)
+        print "discovery, trie:  %.3fs"%discover(
+            tree, libpry.coverage._findFiles
+        )
+    finally:
+        shutil.rmtree(d)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+    Measures the overhead of coverage tracing on a hot loop, comparing the
+    naive tracer pry used to ship (a local trace function on every frame,
+    recording every line event) with the current one, in line, branch,
+    functions and sampling mode.
+"""
+import sys, os, time, tempfile, shutil
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import libpry.coverage
+
+HOT = '''
+import posixpath
+
+
+def hot(n):
+    total = 0
+    for i in xrange(n):
+        if i % 3:
+            total += i
+        else:
+            total -= 1
+    return total
+
+
+def calls(n):
+    for i in xrange(n):
+        small(i)
+
+
+def small(i):
+    return i + 1
+
+
+def external(n):
+    for i in xrange(n):
+        posixpath.basename("a/b")
+'''
+
+N = 300000
+
+
+class NaiveCoverage(libpry.coverage.Coverage):
+    _pathcache = {}
+    def _cachedAbsPath(self, path):
+        a = self._pathcache.get(path)
+        if a:
+            return a
+        else:
+            self._pathcache[path] = os.path.abspath(path)
+            return self._pathcache[path]
+
+    def _globalTrace(self, frame, event, arg):
+        f = self.fileDict.get(
+                self._cachedAbsPath(frame.f_code.co_filename)
+            )
+        if f:
+            def local(frame, event, arg):
+                if event == "line":
+                    f.executed.add(frame.f_lineno)
+                return local
+            return local
+        else:
+            return None
+
+
+def BranchCoverage(path):
+    return libpry.coverage.Coverage(path, branches=True)
+
+
+def FunctionCoverage(path):
+    return libpry.coverage.Coverage(path, functions=True)
+
+
+def SampledCoverage(path):
+    return libpry.coverage.Coverage(path, sample=0.01)
+
+
+def best(func, *args):
+    times = []
+    for i in range(3):
+        start = time.time()
+        func(*args)
+        times.append(time.time() - start)
+    return min(times)
+
+
+def measure(klass, mod):
+    if klass:
+        cov = klass(os.path.dirname(mod.__file__))
+        cov.start()
+    try:
+        return best(mod.hot, N), best(mod.calls, N), best(mod.external, N)
+    finally:
+        if klass:
+            cov.stop()
+
+
+def main():
+    d = tempfile.mkdtemp()
+    try:
+        f = open(os.path.join(d, "hotmod.py"), "w")
+        f.write(HOT)
+        f.close()
+        sys.path.insert(0, d)
+        import hotmod
+        base = measure(None, hotmod)
+        print "%-10s  loop %.3fs  calls %.3fs  external %.3fs"%(
+            ("untraced",) + base
+        )
+        for label, klass in (
+            ("naive", NaiveCoverage),
+            ("current", libpry.coverage.Coverage),
+            ("branches", BranchCoverage),
+            ("functions", FunctionCoverage),
+            ("sampled", SampledCoverage),
+        ):
+            r = measure(klass, hotmod)
+            print "%-10s  loop %.1fx  calls %.1fx  external %.1fx"%(
+                label, r[0]/base[0], r[1]/base[1], r[2]/base[2]
+            )
+    finally:
+        shutil.rmtree(d)
+
+
+if __name__ == "__main__":
+    main()
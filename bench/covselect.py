@@ -0,0 +1,43 @@
+"""
+    Measures test selection on generated per-test coverage data, for a fixed
+    number of tests and a growing number of files, to check that building
+    the per-test line tables and choosing tests scale linearly.
+"""
+import sys, os, time, random
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import libpry.coverage, libpry.covselect
+from libpry.lineset import LineSet
+
+TESTS = 1000
+LINES = 400
+
+
+def makeCoverage(files):
+    r = random.Random(0)
+    cov = libpry.coverage.Coverage(None)
+    cov.fileDict = {}
+    cov.contextNames = ["test%s"%i for i in range(TESTS)]
+    for i in range(files):
+        f = libpry.coverage.File("file%s.py"%i)
+        for line in range(1, LINES):
+            f.contexts[line] = LineSet(r.sample(xrange(TESTS), 5))
+        cov.fileDict[f.path] = f
+    return cov
+
+
+def main():
+    for files in (50, 100, 200):
+        cov = makeCoverage(files)
+        start = time.time()
+        tests = libpry.covselect.testLines(cov)
+        lines = time.time() - start
+        start = time.time()
+        chosen = libpry.covselect.minimize(tests)
+        print "%s tests, %3s files: testLines %.3fs  minimize %.3fs"\
+              "  (%s chosen)"%(
+                  TESTS, files, lines, time.time() - start, len(chosen)
+              )
+
+
+if __name__ == "__main__":
+    main()
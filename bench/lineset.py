@@ -0,0 +1,86 @@
+"""
+    Compares sets and LineSets for the operations used by coverage reports
+    and by combining data files: per-file statistics for a report, and
+    merging the executed lines of many runs. Then compares building a large
+    LineSet in one pass with adding its members one at a time.
+"""
+import sys, os, time, random
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from libpry.lineset import LineSet
+
+FILES = 3000
+LINES = 500
+RUNS = 20
+
+
+def stats(files):
+    total = 0
+    for executable, executed, exclusions in files:
+        total += len(executable - executed)
+        total += len(executed - exclusions)
+    return total
+
+
+def merge(runs):
+    merged = runs[0]
+    for r in runs[1:]:
+        merged = [m | e for m, e in zip(merged, r)]
+    return merged
+
+
+def timed(f, *args):
+    times = []
+    for i in range(3):
+        start = time.time()
+        f(*args)
+        times.append(time.time() - start)
+    return min(times)
+
+
+def size(s):
+    """
+        Memory used by the container itself, not counting any int objects
+        referenced by a set.
+    """
+    if isinstance(s, LineSet):
+        return sys.getsizeof(s) + sys.getsizeof(s.bits)
+    return sys.getsizeof(s)
+
+
+def addEach(lines):
+    s = LineSet()
+    for i in lines:
+        s.add(i)
+    return s
+
+
+def main():
+    r = random.Random(0)
+    executable = range(1, LINES)
+    data = []
+    for i in range(FILES):
+        data.append((
+            set(executable),
+            set(r.sample(executable, LINES/2)),
+            set(r.sample(executable, 10)),
+        ))
+    runs = [[set(r.sample(executable, 50)) for i in range(FILES)]
+                for j in range(RUNS)]
+    for name, kind in [("set", set), ("LineSet", LineSet)]:
+        d = [tuple(kind(s) for s in f) for f in data]
+        rs = [[kind(s) for s in run] for run in runs]
+        print "%-8s report %.3fs  merge %.3fs  %s bytes/file"%(
+            name,
+            timed(stats, d),
+            timed(merge, rs),
+            sum(size(s) for s in d[0]),
+        )
+    for n in (10000, 40000, 160000):
+        lines = range(0, n*4, 4)
+        print "%6s members  constructor %.3fs  add %.3fs"%(
+            n, timed(LineSet, lines), timed(addEach, lines)
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+    Measures the per-test overhead of the output layer, writing verbose
+    output to a pipe. The unbuffered figures reproduce the old behaviour of
+    flushing after every write.
+"""
+import sys, os, time, subprocess
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import libpry.test
+
+TESTS = 20000
+
+
+class Bench(libpry.test.TestContainer):
+    def __init__(self, n):
+        libpry.test.TestContainer.__init__(self, name="bench")
+        for i in xrange(n):
+            self.addChild(libpry.test.CallableNode("test_%s"%i, self.nop))
+
+    def nop(self):
+        pass
+
+
+def run(verbosity, fp, flushSize=None):
+    """
+        Returns the best of three runs, in seconds.
+    """
+    times = []
+    for i in range(3):
+        root = libpry.test._RootNode(False, None)
+        root.addChild(Bench(TESTS))
+        o = libpry.test._Output(root, verbosity, fp)
+        if flushSize is not None:
+            o.flushSize = flushSize
+        start = time.time()
+        root._run(o, 1)
+        o.final(root)
+        times.append(time.time() - start)
+    return min(times)
+
+
+def main():
+    sink = subprocess.Popen(["cat"], stdin=subprocess.PIPE,
+                            stdout=open(os.devnull, "w"))
+    base = run(0, None)
+    print "%s tests, no output: %.2fus per test"%(TESTS, base/TESTS*1e6)
+    for v in (1, 2, 3):
+        for label, size in (("buffered", None), ("unbuffered", 0)):
+            t = run(v, sink.stdin, size)
+            print "verbosity %s, %-10s: %.2fus overhead per test"%(
+                v, label, (t - base)/TESTS*1e6
+            )
+    sink.stdin.close()
+    sink.wait()
+
+
+if __name__ == "__main__":
+    main()
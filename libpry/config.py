@@ -7,6 +7,9 @@
                     paths excluded
                     from coverage
 
+    Exclusions may be glob patterns, like "*/gen_*.py", where "**" matches any
+    number of directories.
+
     The special _magic flag is needed to allow pry to run coverage analysis on
     itsef.
 """
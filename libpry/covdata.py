@@ -0,0 +1,190 @@
+"""
+    Reading, writing and combining coverage data files.
+
+    A data file starts with a short header, followed by a zlib-compressed
+    stream of length-prefixed fields. The first field is the coverage root
+    used for reporting, and the second holds the context names. After that,
+    each covered file is stored as its path, a SHA-1 hash of its source,
+    bitmaps of its executable, excluded and executed lines, in the format of
+    LineSet.tobytes, a field mapping line numbers to bitmaps of context ids,
+    and the taken branch arcs as pairs of signed integers. Runs are combined
+    by OR-ing together the executed lines and arcs of records with the same
+    path and source hash, after offsetting context ids.
+"""
+import struct, zlib, hashlib, os.path
+import coverage
+from lineset import LineSet
+
+MAGIC = "PRYCOV"
+VERSION = 3
+
+
+def sourceHash(data):
+    return hashlib.sha1(data).digest()
+
+
+def _pack(s):
+    return struct.pack(">I", len(s)) + s
+
+
+def write(path, cov):
+    """
+        Write the data held by a coverage.Coverage object to a file.
+    """
+    f = open(path, "wb")
+    try:
+        f.write(MAGIC + chr(VERSION))
+        z = zlib.compressobj()
+        names = "".join([_pack(i) for i in cov.contextNames])
+        f.write(z.compress(_pack(cov.coveragePath) + _pack(names)))
+        for i in cov.fileDict.values():
+            contexts = []
+            for line, ids in sorted(i.contexts.items()):
+                contexts.append(_pack(struct.pack(">I", line)))
+                contexts.append(_pack(ids.tobytes()))
+            arcs = [struct.pack(">ii", *a) for a in sorted(i.arcs)]
+            f.write(
+                z.compress(
+                    "".join([
+                        _pack(i.path),
+                        _pack(i.hash),
+                        _pack(i.executable.tobytes()),
+                        _pack(i.exclusions.tobytes()),
+                        _pack(i.executed.tobytes()),
+                        _pack("".join(contexts)),
+                        _pack("".join(arcs)),
+                    ])
+                )
+            )
+        f.write(z.flush())
+    finally:
+        f.close()
+
+
+def _fields(data):
+    offset = 0
+    while offset < len(data):
+        l, = struct.unpack(">I", data[offset:offset+4])
+        offset += 4
+        yield data[offset:offset+l]
+        offset += l
+
+
+def _coverage(root, contextNames, files):
+    c = coverage.Coverage(None)
+    c.coveragePath = root
+    c.contextNames = contextNames
+    c.fileDict = dict([(f.path, f) for f in files])
+    return c
+
+
+def read(path):
+    """
+        Read a coverage data file. Returns a coverage.Coverage object.
+    """
+    data = open(path, "rb").read()
+    if data[:len(MAGIC)] != MAGIC:
+        raise ValueError("Not a coverage data file: %s"%path)
+    if ord(data[len(MAGIC)]) != VERSION:
+        raise ValueError("Unsupported coverage data version: %s"%path)
+    fields = _fields(zlib.decompress(data[len(MAGIC)+1:]))
+    root = fields.next()
+    contextNames = list(_fields(fields.next()))
+    files = []
+    for p in fields:
+        f = coverage.File(None)
+        f.path = p
+        f.hash = fields.next()
+        f.executable = LineSet.frombytes(fields.next())
+        f.exclusions = LineSet.frombytes(fields.next())
+        f.executed = LineSet.frombytes(fields.next())
+        f.contexts = {}
+        contexts = _fields(fields.next())
+        for line in contexts:
+            line, = struct.unpack(">I", line)
+            f.contexts[line] = LineSet.frombytes(contexts.next())
+        arcs = fields.next()
+        f.arcs = set(
+            struct.unpack(">ii", arcs[i:i+8]) for i in range(0, len(arcs), 8)
+        )
+        # Hit counts are not saved.
+        f.hits, f.times = {}, {}
+        files.append(f)
+    return _coverage(root, contextNames, files)
+
+
+def _currentHash(path):
+    try:
+        return sourceHash(open(path, "r").read())
+    except IOError:
+        return None
+
+
+def _copy(f, offset):
+    """
+        Copy a File's coverage data, adding offset to its context ids.
+    """
+    n = coverage.File(None)
+    n.path, n.hash = f.path, f.hash
+    n.executable, n.exclusions = f.executable, f.exclusions
+    n.executed = f.executed.copy()
+    n.arcs = set(f.arcs)
+    n.hits, n.times = dict(f.hits), dict(f.times)
+    n.contexts = {}
+    for line, ids in f.contexts.items():
+        n.contexts[line] = LineSet(bits=ids.bits << offset)
+    return n
+
+
+def _add(current, f):
+    """
+        Add the coverage data of File f to File current.
+    """
+    current.executed |= f.executed
+    current.arcs |= f.arcs
+    coverage._addCounts(current.hits, f.hits)
+    coverage._addCounts(current.times, f.times)
+    for line, ids in f.contexts.items():
+        current.contexts.setdefault(line, LineSet()).update(ids)
+
+
+def merge(covs):
+    """
+        Merge the data held by a number of coverage.Coverage objects, which
+        are not modified. Returns a new coverage.Coverage object.
+
+        When records for the same path have different source hashes, the one
+        that matches the file currently on disk is kept. If none match, the
+        first one is kept.
+    """
+    roots, contextNames, fileDict = [], [], {}
+    for c in covs:
+        roots.append(c.coveragePath)
+        offset = len(contextNames)
+        contextNames.extend(c.contextNames)
+        for f in c.fileDict.values():
+            current = fileDict.get(f.path)
+            if current is None:
+                fileDict[f.path] = _copy(f, offset)
+            elif current.hash == f.hash:
+                _add(current, _copy(f, offset))
+            elif f.hash == _currentHash(f.path):
+                fileDict[f.path] = _copy(f, offset)
+    return _coverage(commonRoot(roots), contextNames, fileDict.values())
+
+
+def combine(paths):
+    """
+        Merge a number of coverage data files. Returns a coverage.Coverage
+        object holding the combined results.
+    """
+    return merge([read(p) for p in paths])
+
+
+def commonRoot(paths):
+    """
+        Returns the deepest directory containing all of a list of paths.
+    """
+    if len(set(paths)) == 1:
+        return paths[0]
+    return os.path.dirname(os.path.commonprefix([i + os.sep for i in paths]))
@@ -1,18 +1,191 @@
 import parser, token, symbol, copy, getopt, types
-import time, os.path, sys, tokenize, re
+import time, os.path, sys, tokenize, re, dis, hashlib, marshal, bisect
+import multiprocessing, multiprocessing.util, threading, thread
+import atexit, tempfile, shutil, cStringIO, inspect
 import utils
+from lineset import LineSet
 
 _coverRe = re.compile("\s*#\s*(begin|end)\s+nocover", re.I)
-class File:
+
+# Names the data directory of a Coverage run that records subprocesses.
+_subprocessEnv = "PRY_COVERAGE"
+
+# Put on the PYTHONPATH of subprocesses. Starts coverage, and then loads any
+# sitecustomize module it shadows. Errors are ignored, so that subprocesses
+# running other Python versions are not affected. The shadowed module is
+# loaded in its own block, so that it still runs if coverage can't start.
+_siteCustomize = """\
+# Written by pry, to record coverage in Python subprocesses.
+try:
+    import sys
+    sys.path.append(%(libdir)r)
+    try:
+        import libpry.coverage
+        libpry.coverage.startSubprocess()
+    finally:
+        sys.path.remove(%(libdir)r)
+except Exception:
+    pass
+try:
+    import sys, os, imp
+    _path = [
+        i for i in sys.path
+        if os.path.realpath(i or ".") != os.path.realpath(%(dir)r)
+    ]
+    imp.load_module("sitecustomize", *imp.find_module("sitecustomize", _path))
+except Exception:
+    pass
+"""
+
+_condJumps = set([
+    dis.opmap[i] for i in [
+        "POP_JUMP_IF_FALSE", "POP_JUMP_IF_TRUE", "JUMP_IF_FALSE_OR_POP",
+        "JUMP_IF_TRUE_OR_POP", "FOR_ITER"
+    ]
+])
+_jumps = set([
+    dis.opmap[i] for i in ["JUMP_FORWARD", "JUMP_ABSOLUTE", "CONTINUE_LOOP"]
+])
+# Instructions after which the destination can't be worked out statically.
+_stops = set([dis.opmap[i] for i in ["RAISE_VARARGS", "BREAK_LOOP"]])
+class AnalysisCache:
+    """
+        An on-disk cache of the static analysis of source files, so that
+        files are only read, compiled and scanned again once they change.
+
+        Entries are keyed by absolute path, and are valid while the file's
+        modification time and size stay the same. Line sets are stored as the
+        longs backing them. The whole cache is thrown away if it was written
+        by a different Python version, since the line tables it was built
+        from may differ, or with a different format version.
+
+        If path is None, the cache is only kept in memory.
+    """
+    version = 4
     def __init__(self, path):
+        self.path = path and os.path.abspath(path)
+        self.entries = self._load()
+        self.dirty = False
+
+    def _load(self):
+        if not self.path:
+            return {}
+        try:
+            version, entries = marshal.load(open(self.path, "rb"))
+        except (IOError, EOFError, ValueError, TypeError):
+            return {}
+        if version != (sys.version, self.version):
+            return {}
+        return entries
+
+    def save(self):
+        if not (self.dirty and self.path):
+            return
+        tmp = self.path + ".tmp"
+        try:
+            f = open(tmp, "wb")
+            marshal.dump(((sys.version, self.version), self.entries), f)
+            f.close()
+            os.rename(tmp, self.path)
+        except (IOError, OSError):
+            pass
+        self.dirty = False
+
+    def _stat(self, path):
+        st = os.stat(path)
+        return st.st_mtime, st.st_size
+
+    def get(self, path):
+        """
+            Returns a (hash, executable, exclusions, functions) tuple for
+            path, or None if there is no valid entry.
+        """
+        e = self.entries.get(path)
+        if e and e[:2] == self._stat(path):
+            return e[2], LineSet(bits=e[3]), LineSet(bits=e[4]), e[5]
+        return None
+
+    def put(self, path, hash, executable, exclusions, functions):
+        self.entries[path] = self._stat(path) + (
+            hash, executable.bits, exclusions.bits, functions
+        )
+        self.dirty = True
+
+
+class File:
+    """
+        Coverage information for a single source file.
+
+        The static analysis of the file - its hash, executable lines,
+        exclusions and functions - is done lazily, the first time any of them
+        is needed.
+        Registering a file is therefore cheap, and files that are never run
+        are only analysed if a report asks for them.
+
+        Executable, executed and excluded lines are held in LineSets.
+    """
+    _analysed = ("hash", "executable", "exclusions", "functions")
+    cache = None
+    def __init__(self, path, cache=None):
+        """
+            path    - Path to the source file.
+            cache   - An optional AnalysisCache.
+        """
         if path:
             self.path = os.path.abspath(path)
-            data = open(path, "r").read()
-            code = compile(data, path, "exec")
-            self.exclusions = self.getExclusions(data, path)
-            lines = self.getLines(code)
-            self.executable = lines - self.exclusions
-            self.executed = set()
+            self.cache = cache
+            self.executed = LineSet()
+            # Taken (from, to) arcs from branch lines, in branch mode.
+            self.arcs = set()
+            # Maps line numbers to LineSets of context ids.
+            self.contexts = {}
+            # Map line numbers to hit counts, and to the time spent on the
+            # line in seconds, in hits mode.
+            self.hits = {}
+            self.times = {}
+            # The first lines of the functions called, in functions mode.
+            self.called = LineSet()
+
+    def __getattr__(self, attr):
+        if "path" in self.__dict__:
+            if attr in self._analysed:
+                self.analyse()
+                return self.__dict__[attr]
+            elif attr == "branches":
+                code = compile(open(self.path, "r").read(), self.path, "exec")
+                self.branches = self.getBranches(code)
+                return self.branches
+        raise AttributeError(attr)
+
+    @property
+    def analysed(self):
+        return "executable" in self.__dict__
+
+    def setAnalysis(self, hash, executable, exclusions, functions):
+        self.hash, self.executable, self.exclusions, self.functions = (
+            hash, executable, exclusions, functions
+        )
+        if self.cache:
+            self.cache.put(self.path, hash, executable, exclusions, functions)
+
+    def fromCache(self):
+        """
+            Take the analysis from the cache if possible. Returns True on
+            success.
+        """
+        entry = self.cache and self.cache.get(self.path)
+        if entry:
+            self.hash, self.executable, self.exclusions, self.functions = entry
+            return True
+        return False
+
+    def analyse(self):
+        """
+            Read and compile the source file, and work out which of its lines
+            are executable.
+        """
+        if not self.fromCache():
+            self.setAnalysis(*_analyse(self.path))
 
     def __cmp__(self, other):
         c = cmp(other.percentage, self.percentage)
@@ -42,7 +215,7 @@ class File:
         maximum = width - leftMargin
         lst.append(" "*(leftMargin-1))
         for i in ranges:
-            if utils.isNumeric(i):
+            if utils.isNumeric(i) or isinstance(i, basestring):
                 s = "%s"%(i)
             else:
                 s = "[%s...%s]"%(i[0], i[1])
@@ -97,9 +270,12 @@ class File:
                     continue
                 if byte == 0:
                     lst.append(cum + line)
-                    cum = 0
                 else:
+                    # A jump of exactly 255 lines ends at a line of its own.
+                    if cum:
+                        lst.append(cum)
                     lst.append(line)
+                cum = 0
             if cum:
                 lst.append(cum)
         return lst
@@ -131,6 +307,52 @@ class File:
                 linenos.add(code.co_firstlineno)
         return linenos
 
+    def getBranches(self, code):
+        """
+            Returns a dictionary mapping each branch line in a code object
+            and its nested code objects to the set of lines that can follow
+            it. A negative line number means exit from the code object
+            starting at that line.
+        """
+        d = {}
+        for l, dests in _codeBranches(code).items():
+            d.setdefault(l, set()).update(dests)
+        for c in code.co_consts:
+            if isinstance(c, types.CodeType):
+                for l, dests in self.getBranches(c).items():
+                    d.setdefault(l, set()).update(dests)
+        return d
+
+    @property
+    def notCalled(self):
+        """
+            A sorted list of the names of functions not called.
+        """
+        return sorted([
+            name for l, name in self.functions.items() if l not in self.called
+        ])
+
+    @property
+    def possibleArcs(self):
+        """
+            The set of (from, to) arcs out of executable branch lines, leaving
+            out arcs into excluded lines.
+        """
+        return set([
+            (l, d) for l, dests in self.branches.items()
+            if l in self.executable
+            for d in dests if d < 0 or d not in self.exclusions
+        ])
+
+    @property
+    def missingArcs(self):
+        """
+            Arcs not taken from branch lines that were executed.
+        """
+        return set([
+            i for i in self.possibleArcs - self.arcs if i[0] in self.executed
+        ])
+
     def getExclusions(self, data, filename):
         """
             Returns a set of lines covered by exclusion directives, excluding
@@ -161,20 +383,341 @@ class File:
         """
             Returns version of the source file with un-run lines annotated.
         """
-        lines = open(self.path, "r").readlines()
-        for i in self.notExecuted:
-            lines[i-1] = "> " + lines[i-1]
-        return "".join(lines)
+        s = cStringIO.StringIO()
+        _writeAnnotation(self.path, self.notExecuted, s)
+        return s.getvalue()
+
+    def getHeatmap(self):
+        """
+            Returns a version of the source file with the hit count and time
+            of each line that ran, in hits mode.
+        """
+        s = cStringIO.StringIO()
+        _writeHeatmap(self.path, self.hits, self.times, s)
+        return s.getvalue()
+
+    def hottest(self, n):
+        """
+            Returns a list of the (time, hits, line) tuples of the n lines
+            with the most time spent on them, hottest first.
+        """
+        l = [(t, self.hits.get(i, 0), i) for i, t in self.times.items()]
+        l.sort(key=lambda x: (-x[0], x[2]))
+        return l[:n]
+
+
+def _writeLines(path, prefix, out):
+    """
+        Write the source file at path to out a line at a time, each line
+        preceded by prefix(lineno).
+    """
+    f = open(path, "r")
+    try:
+        for i, l in enumerate(f):
+            out.write(prefix(i + 1))
+            out.write(l)
+    finally:
+        f.close()
+
+
+def _writeAnnotation(path, missed, out):
+    """
+        Write the source file at path to out, marking the lines in missed.
+    """
+    _writeLines(path, lambda n: "> " if n in missed else "", out)
+
+
+def _writeHeatmap(path, hits, times, out):
+    """
+        Write the source file at path to out, each line preceded by its hit
+        count and time, if it ran.
+    """
+    def prefix(n):
+        if n in hits:
+            return "%8s %9.6f | "%(hits[n], times.get(n, 0))
+        return "%8s %9s | "%("", "")
+    _writeLines(path, prefix, out)
+
+
+def _analyse(path):
+    """
+        Returns a (hash, executable, exclusions, functions) tuple for a
+        source file. Functions maps the first lines of the functions that are
+        not excluded to their names, as found by _codeFunctions.
+    """
+    f = File(None)
+    data = open(path, "r").read()
+    code = compile(data, path, "exec")
+    exclusions = LineSet(f.getExclusions(data, path))
+    executable = LineSet(f.getLines(code)) - exclusions
+    functions = dict([
+        (l, name) for l, name in _codeFunctions(code).items()
+        if l not in exclusions
+    ])
+    return hashlib.sha1(data).digest(), executable, exclusions, functions
+
+
+def _findFiles(path, excludeList):
+    """
+        Returns a list of the .py files under path, not included in the
+        excludeList. Entries in the excludeList may be glob patterns.
+        Excluded directories are not walked.
+    """
+    if os.path.isfile(path):
+        return [path]
+    l = []
+    for root, dirs, files in utils.PathMatcher(excludeList).walk(path):
+        for f in files:
+            if f.endswith(".py"):
+                l.append(os.path.join(root, f))
+    return l
+
+
+def _addCounts(d, counts):
+    """
+        Add the hit counts or times in counts to those in d.
+    """
+    for k, v in counts.items():
+        d[k] = d.get(k, 0) + v
+
+
+def _instructions(code):
+    """
+        Returns a dictionary mapping bytecode offsets to (opcode, jump target,
+        next offset) tuples. The jump target is None for instructions that
+        don't jump.
+    """
+    d = {}
+    co = code.co_code
+    i, ext = 0, 0
+    while i < len(co):
+        op = ord(co[i])
+        target = None
+        if op >= dis.HAVE_ARGUMENT:
+            arg = ord(co[i+1]) + ord(co[i+2])*256 + ext
+            ext = 0
+            nxt = i + 3
+            if op == dis.EXTENDED_ARG:
+                ext = arg*65536
+            elif op in dis.hasjrel:
+                target = nxt + arg
+            elif op in dis.hasjabs:
+                target = arg
+        else:
+            nxt = i + 1
+        d[i] = (op, target, nxt)
+        i = nxt
+    return d
+
+
+def _codeBranches(code):
+    """
+        Returns a dictionary mapping each line of a code object (not
+        including nested code objects) that can be followed by more than one
+        line to the set of lines that can follow it.
+
+        Control flow is followed from each conditional jump to the next
+        instruction that produces a line event: the start of a line, or the
+        target of a backward jump. Reaching a return produces an exit arc,
+        shown as the negated first line of the code object.
+    """
+    starts = dict(dis.findlinestarts(code))
+    offsets = sorted(starts)
+    instrs = _instructions(code)
+    exit = -code.co_firstlineno
+
+    def lineOf(offset):
+        return starts[offsets[bisect.bisect(offsets, offset) - 1]]
+
+    def follow(frm, to, dests, seen):
+        if to < frm:
+            dests.add(lineOf(to))
+            return
+        if to in seen or to not in instrs:
+            return
+        seen.add(to)
+        if to in starts:
+            dests.add(starts[to])
+            return
+        op, target, nxt = instrs[to]
+        if op == dis.opmap["RETURN_VALUE"]:
+            dests.add(exit)
+        elif op in _stops:
+            return
+        elif op in _jumps:
+            follow(to, target, dests, seen)
+        else:
+            follow(to, nxt, dests, seen)
+            if op in _condJumps:
+                follow(to, target, dests, seen)
+
+    branches = {}
+    for offset, (op, target, nxt) in sorted(instrs.items()):
+        if op in _condJumps and offsets and offset >= offsets[0]:
+            dests = branches.setdefault(lineOf(offset), set())
+            follow(offset, nxt, dests, set())
+            follow(offset, target, dests, set())
+    return dict([(l, d) for l, d in branches.items() if len(d) > 1])
+
+
+def _codeFunctions(code, prefix=""):
+    """
+        Returns a dictionary mapping the first lines of the functions and
+        methods in a code object and its nested code objects to their names.
+        Nested names are qualified by the names of the classes and functions
+        they are defined in. Class bodies, lambdas and generator expressions
+        are left out.
+    """
+    d = {}
+    for c in code.co_consts:
+        if isinstance(c, types.CodeType):
+            name = prefix + c.co_name
+            if c.co_flags & inspect.CO_OPTIMIZED and \
+                not c.co_name.startswith("<"):
+                d[c.co_firstlineno] = name
+            d.update(_codeFunctions(c, name + "."))
+    return d
+
+
+def _codeLines(code):
+    """
+        Returns the set of lines that start instructions in a code object,
+        not including nested code objects.
+    """
+    return set([l for (_, l) in dis.findlinestarts(code)])
 
 
 class Coverage:
-    _pathcache = {}
-    def __init__(self, coveragePath, excludeList=[], dummy=False):
+    """
+        Line coverage analysis.
+
+        The tracer records each line once. For every code object it keeps the
+        set of executable lines that have not yet been seen, and once this is
+        empty the code object is never traced again: running frames drop
+        their local trace function, and new frames are not given one. Hot
+        loops in fully covered code then run at close to full speed.
+
+        Decisions are cached per code object, keyed by identity, so frames
+        from files outside the coverage path cost a single dictionary lookup.
+        The cache holds at most maxCodeCache entries, and is simply emptied
+        when it fills up - every decision can be recomputed from fileDict.
+
+        In context mode, lines are also attributed to the context - usually a
+        test - that was active when they ran. Each context gets a numeric id,
+        and every File keeps a map from line numbers to LineSets of the ids
+        of contexts that ran the line. Lines are recorded once per context
+        rather than once per run, by emptying the decision cache whenever the
+        context changes.
+
+        Threads started while coverage is running are traced too. Each gets
+        a _ThreadRecorder with its own decision cache and LineSets, so
+        threads never share mutable tracer state and no locking is needed on
+        line events. Their results are merged into fileDict by stop(), and
+        are not attributed to contexts.
+
+        With subprocesses on, start() creates a data directory holding a
+        sitecustomize module, and puts it on the PYTHONPATH, so that Python
+        subprocesses start recording coverage of the same path as soon as
+        they start up. Children forked by multiprocessing keep the tracer
+        they inherit, and start again with empty data. Either kind of child
+        writes its data to a file in the data directory when it exits, and
+        stop() merges these files into fileDict. Subprocesses record in the
+        same mode as the parent, so hit counts, times and the functions called
+        are collected too. Lines run by forked children are attributed to the
+        context that was active when they were forked, and lines run by other
+        subprocesses to no context.
+
+        In hits mode, frames in covered code are traced for as long as they
+        run, and every line event adds to the hit count of its line, and adds
+        the wall time since the frame's previous event to the line that was
+        running. Time spent in calls is counted against the calling line.
+        This is much slower than line coverage, and is meant for finding hot
+        spots rather than for routine runs.
+
+        In functions mode, the tracer is only called for new frames, and
+        never returns a local trace function, so there are no line events at
+        all. A global trace function is used rather than a profile function,
+        since the interpreter calls a profile function for returns and calls
+        into C as well. The first time the tracer sees a code object, it
+        works out whether it is covered, and if so records its first line.
+        After that, calls only cost a lookup in a decision cache, kept like
+        _codeCache. stop() adds the lines recorded to the called lines of
+        each File. Line data and contexts are not recorded in this mode.
+
+        In sampling mode, nothing is traced. Instead, a sampler thread wakes
+        up every sample seconds, and records the current line of every frame
+        on the stack of every other thread, using the same decision cache as
+        the tracers. The overhead is set by the interval rather than by the
+        code under test, but lines that run between samples are missed, so
+        the results are approximate, and reports say so.
+
+        In branch mode, the tracer also records (from, to) arcs out of branch
+        lines, as found by _codeBranches, and a code object stops being
+        traced once all of its lines and arcs have been seen. This costs an
+        extra tuple and set lookup per line event. On bench/coverage.py,
+        tracing in branch mode costs up to about 2x as much as line coverage.
+    """
+    maxCodeCache = 10000
+    def __init__(self, coveragePath, excludeList=[], dummy=False, cache=None,
+                 contexts=False, branches=False, subprocesses=False,
+                 session=None, hits=False, functions=False, sample=None):
         """
             coveragePath    - Path to the file tree that will be analysed.
             excludeList     - List of exceptions to coverage analysis.
+            cache           - An optional AnalysisCache.
+            contexts        - Record which context ran each line.
+            branches        - Record branch coverage.
+            subprocesses    - Record coverage in Python subprocesses.
+            session         - An optional Session this object is part of.
+            hits            - Record hit counts and times for each line.
+            functions       - Record only which functions are called.
+            sample          - Sample running lines at this interval in
+                              seconds, instead of tracing.
         """
         self.dummy = dummy
+        self.session = session
+        self.hits = hits
+        self.functions = functions
+        # Maps id(code) to the code objects seen, in functions mode. Like
+        # _codeCache, it is cleared when it fills up.
+        self._called = {}
+        # Maps paths to sets of the first lines of the covered functions
+        # called, in functions mode.
+        self._calledLines = {}
+        self.sample = sample
+        # The sampler thread and the event that stops it, while sampling.
+        self._sampler = None
+        self._sampling = None
+        self.branches = branches
+        self.subprocesses = subprocesses
+        # The directory subprocesses write their data to, while running.
+        self.dataDir = None
+        # Environment variables to restore when we stop, or None.
+        self._environ = None
+        if subprocesses:
+            multiprocessing.util.register_after_fork(self, Coverage._afterFork)
+        self.cache = cache
+        self.contexts = contexts
+        # Context names, indexed by id.
+        self.contextNames = []
+        self._context = None
+        # Maps paths to the lines run in the current context.
+        self._contextLines = {}
+        self._recorders = []
+        self.tracing = False
+        # Maps id(code) to a (code, lines, branches) tuple, holding the
+        # results of _codeLines and, in branch mode, _codeBranches. Unlike
+        # _codeCache, this survives context switches. It is shared by the
+        # members of a Session.
+        self._lineCache = session._lineCache if session else {}
+        # Maps id(code) to a (code, executed, remaining) tuple. The code
+        # object is kept to make sure its id can't be re-used while cached.
+        # Executed is the LineSet lines are recorded in. Remaining is the
+        # set of lines not yet executed, and is None if the code is not
+        # covered. In branch mode, the tuple also holds the set of arcs not
+        # yet taken, and the set taken arcs are recorded in. In hits mode, it
+        # ends with the dictionaries hits and times are recorded in.
+        self._codeCache = {}
         if coveragePath:
             self.excludeList = [os.path.abspath(x) for x in excludeList]
             self.coveragePath = os.path.abspath(coveragePath)
@@ -183,28 +726,98 @@ class Coverage:
     def getFileDict(self, path, excludeList):
         """
             Recursively finds all .py files not included in the excludelist.
-            Returns a set of File objects.
+            Returns a dictionary mapping paths to File objects.
         """
-        if os.path.isfile(path):
-            return {path: File(path)}
-        d = dict()
-        for root, dirs, files in os.walk(path):
-            for f in files:
-                if f.endswith(".py"):
-                    p = os.path.join(root, f)
-                    if not utils.isPathContainedAny(excludeList, p):
-                        d[p] = File(p)
-        return d
-
-    # begin nocover
-    def _cachedAbsPath(self, path):
-        a = self._pathcache.get(path)
-        if a:
-            return a
+        if self.session:
+            paths = self.session.findFiles(path, excludeList)
         else:
-            self._pathcache[path] = os.path.abspath(path)
-            return self._pathcache[path]
+            paths = _findFiles(path, excludeList)
+        return dict([(p, File(p, self.cache)) for p in paths])
+
+    def _target(self, f):
+        """
+            The LineSet the tracer should record lines from File f in.
+        """
+        if self.contexts:
+            return self._contextLines.setdefault(f.path, LineSet())
+        return f.executed
+
+    def _hitTarget(self, f):
+        """
+            Returns the (hits, times) dictionaries to record f's hit counts
+            and times in.
+        """
+        return f.hits, f.times
+
+    def _tracer(self):
+        """
+            Returns the trace function for the current mode.
+        """
+        if self.functions:
+            return self._functionTrace
+        elif self.hits:
+            return self._hitTrace
+        elif self.branches:
+            return self._branchTrace
+        return self._globalTrace
 
+    def _classify(self, code):
+        """
+            Work out, and cache, what the tracer should do with a code object.
+        """
+        f = self.fileDict.get(os.path.abspath(code.co_filename))
+        executed, remaining = None, None
+        if f:
+            executed = self._target(f)
+            try:
+                todo = f.executable - executed
+            except (SyntaxError, ValueError, EnvironmentError):
+                # The file can't be analysed. Leave it to the report to raise
+                # the error, rather than raising it in the traced code.
+                todo = LineSet()
+            lines = self._lineCache.get(id(code))
+            if lines is None or lines[0] is not code:
+                lines = self._lineCache[id(code)] = (
+                    code,
+                    _codeLines(code),
+                    self.branches and _codeBranches(code)
+                )
+            remaining = set([i for i in lines[1] if i in todo])
+        if len(self._codeCache) >= self.maxCodeCache:
+            self._codeCache.clear()
+            self._lineCache.clear()
+        entry = (code, executed, remaining)
+        if self.branches:
+            arcs = set()
+            if remaining is not None and f.analysed:
+                for l, dests in lines[2].items():
+                    if l in f.executable:
+                        arcs.update([
+                            (l, d) for d in dests
+                            if d < 0 or d not in f.exclusions
+                        ])
+                arcs -= f.arcs
+            entry += (arcs, f and f.arcs)
+        if self.hits:
+            entry += self._hitTarget(f) if f else (None, None)
+        self._codeCache[id(code)] = entry
+        return entry
+
+    def _classifyFunction(self, code):
+        """
+            Record the first line of a code object in functions mode, if it
+            is covered, and remember that it has been seen. The sets lines
+            are recorded in are shared by all threads, so they are only ever
+            added to.
+        """
+        path = os.path.abspath(code.co_filename)
+        if path in self.fileDict:
+            self._calledLines.setdefault(path, set()).add(code.co_firstlineno)
+        if len(self._called) >= self.maxCodeCache:
+            self._called.clear()
+        self._called[id(code)] = code
+
+    # begin nocover
     def _globalTrace(self, frame, event, arg):
         """
             This method will produce incorrect coverage results in Python
@@ -212,27 +825,410 @@ class Coverage:
 
                 http://svn.python.org/view?rev=58963&view=rev
         """
-        f = self.fileDict.get(
-                self._cachedAbsPath(frame.f_code.co_filename)
-            )
-        if f:
-            def local(frame, event, arg):
-                if event == "line":
-                    f.executed.add(frame.f_lineno)
-                return local
+        code = frame.f_code
+        entry = self._codeCache.get(id(code)) or self._classify(code)
+        remaining = entry[2]
+        if not remaining:
+            return None
+        executed = entry[1]
+        def local(frame, event, arg):
+            if event == "line":
+                lineno = frame.f_lineno
+                if lineno in remaining:
+                    remaining.discard(lineno)
+                    executed.add(lineno)
+                if not remaining:
+                    frame.f_trace = None
+                    return None
             return local
-        else:
+        return local
+
+    def _branchTrace(self, frame, event, arg):
+        """
+            The tracer used in branch mode.
+        """
+        code = frame.f_code
+        entry = self._codeCache.get(id(code)) or self._classify(code)
+        remaining, arcs = entry[2], entry[3]
+        if not (remaining or arcs):
+            return None
+        executed, taken = entry[1], entry[4]
+        exit = -code.co_firstlineno
+        last = [None]
+        def local(frame, event, arg):
+            if event == "line":
+                lineno = frame.f_lineno
+                if lineno in remaining:
+                    remaining.discard(lineno)
+                    executed.add(lineno)
+                arc = (last[0], lineno)
+                if arc in arcs:
+                    arcs.discard(arc)
+                    taken.add(arc)
+                last[0] = lineno
+                if not (remaining or arcs):
+                    frame.f_trace = None
+                    return None
+            elif event == "return":
+                arc = (last[0], exit)
+                if arc in arcs:
+                    arcs.discard(arc)
+                    taken.add(arc)
+            return local
+        return local
+
+    def _hitTrace(self, frame, event, arg):
+        """
+            The tracer used in hits mode.
+        """
+        code = frame.f_code
+        entry = self._codeCache.get(id(code)) or self._classify(code)
+        remaining = entry[2]
+        if remaining is None:
             return None
+        executed, hits, times = entry[1], entry[-2], entry[-1]
+        arcs, taken = (entry[3], entry[4]) if self.branches else ((), None)
+        clock = time.time
+        # The running line, and the time of the last event.
+        last = [None, clock()]
+        def local(frame, event, arg):
+            now = clock()
+            prev = last[0]
+            if prev is not None:
+                times[prev] = times.get(prev, 0) + now - last[1]
+            if event == "line":
+                lineno = frame.f_lineno
+                hits[lineno] = hits.get(lineno, 0) + 1
+                if lineno in remaining:
+                    remaining.discard(lineno)
+                    executed.add(lineno)
+                if (prev, lineno) in arcs:
+                    arcs.discard((prev, lineno))
+                    taken.add((prev, lineno))
+                last[0] = lineno
+            elif event == "return":
+                if (prev, -code.co_firstlineno) in arcs:
+                    arcs.discard((prev, -code.co_firstlineno))
+                    taken.add((prev, -code.co_firstlineno))
+            last[1] = clock()
+            return local
+        return local
+
+    def _functionTrace(self, frame, event, arg):
+        """
+            The tracer used in functions mode. It is only ever called for
+            new frames, and never traces their lines.
+        """
+        if id(frame.f_code) not in self._called:
+            self._classifyFunction(frame.f_code)
+
+    def _sampleLoop(self, stopped):
+        """
+            The body of the sampler thread.
+        """
+        me = thread.get_ident()
+        # Event.wait only returns the flag from Python 2.7.
+        while True:
+            stopped.wait(self.sample)
+            if stopped.isSet():
+                break
+            frames = sys._current_frames()
+            frames.pop(me, None)
+            self._sampleFrames(frames.values())
+
+    def _threadTrace(self, frame, event, arg):
+        """
+            Installed with threading.settrace. Sets up a recorder for the new
+            thread, and hands over to its tracer.
+        """
+        r = _ThreadRecorder(self)
+        self._recorders.append(r)
+        trace = r._tracer()
+        sys.settrace(trace)
+        return trace(frame, event, arg)
 
     def start(self):
+        if self.session:
+            self.session._starting(self)
         if not self.dummy:
-            sys.settrace(self._globalTrace)
+            if self.subprocesses and not self.dataDir:
+                self._exportEnv()
+            self.tracing = True
+            if self.sample:
+                self._sampling = threading.Event()
+                self._sampler = threading.Thread(
+                    target=self._sampleLoop, args=(self._sampling,)
+                )
+                self._sampler.setDaemon(True)
+                self._sampler.start()
+            else:
+                if self.functions:
+                    threading.settrace(self._functionTrace)
+                else:
+                    threading.settrace(self._threadTrace)
+                sys.settrace(self._tracer())
 
     def stop(self):
         if not self.dummy:
             sys.settrace(None)
+            threading.settrace(None)
+            if self._sampler:
+                self._sampling.set()
+                self._sampler.join()
+                self._sampler = None
+            self.tracing = False
+        if self.session:
+            self.session._stopped(self)
+        self._flushContext()
+        self._mergeThreads()
+        self._mergeFunctions()
+        if self._environ is not None:
+            self._collectSubprocesses()
     # end nocover
 
+    def _exportEnv(self):
+        """
+            Create a data directory holding a sitecustomize module and the
+            coverage settings, and point the environment at it.
+        """
+        self.dataDir = tempfile.mkdtemp(prefix="pry")
+        f = open(os.path.join(self.dataDir, "config"), "wb")
+        marshal.dump(
+            dict(
+                coveragePath=self.coveragePath,
+                excludeList=self.excludeList,
+                cache=self.cache.path if self.cache else None,
+                branches=self.branches,
+                hits=self.hits,
+                functions=self.functions,
+                sample=self.sample,
+            ),
+            f
+        )
+        f.close()
+        libdir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        f = open(os.path.join(self.dataDir, "sitecustomize.py"), "w")
+        f.write(_siteCustomize%dict(libdir=libdir, dir=self.dataDir))
+        f.close()
+        self._environ = {}
+        for k in (_subprocessEnv, "PYTHONPATH"):
+            self._environ[k] = os.environ.get(k)
+        os.environ[_subprocessEnv] = self.dataDir
+        os.environ["PYTHONPATH"] = os.pathsep.join(
+            filter(None, [self.dataDir, os.environ.get("PYTHONPATH")])
+        )
+
+    def _collectSubprocesses(self):
+        """
+            Restore the environment, merge the data files written by
+            subprocesses into fileDict, and remove the data directory.
+        """
+        for k, v in self._environ.items():
+            if v is None:
+                os.environ.pop(k, None)
+            else:
+                os.environ[k] = v
+        self._environ = None
+        for i in sorted(os.listdir(self.dataDir)):
+            if i.endswith(".prycoverage"):
+                f = open(os.path.join(self.dataDir, i), "rb")
+                self._addData(marshal.load(f))
+                f.close()
+        shutil.rmtree(self.dataDir, True)
+        self.dataDir = None
+
+    def _afterFork(self):
+        """
+            Called in children forked by multiprocessing. The data the child
+            inherited belongs to the parent, so it is thrown away, in place,
+            since running frames hold on to the LineSets.
+        """
+        if not self.tracing:
+            return
+        self._environ = None
+        self._codeCache.clear()
+        for lines in self._contextLines.values():
+            lines.bits = 0
+        for r in self._recorders:
+            for lines in r.lines.values():
+                lines.bits = 0
+        for r in self._recorders:
+            for hits, times in r.hitData.values():
+                hits.clear()
+                times.clear()
+        self._called.clear()
+        for lines in self._calledLines.values():
+            lines.clear()
+        for f in self.fileDict.values():
+            f.executed.bits = 0
+            f.called.bits = 0
+            f.arcs.clear()
+            f.hits.clear()
+            f.times.clear()
+            f.contexts = {}
+        if self._context is None:
+            self.contextNames = []
+        else:
+            self.contextNames = [self.contextNames[self._context]]
+            self._context = 0
+        # Forked children leave through os._exit, so atexit is not run.
+        self._finalizer = multiprocessing.util.Finalize(
+            None, self._saveSubprocess, exitpriority=0
+        )
+
+    def _saveSubprocess(self):
+        """
+            Stop, and write the files run in this process to a new data file
+            in dataDir. Errors are ignored - the parent may have stopped and
+            removed the directory already.
+        """
+        self.stop()
+        try:
+            fd, tmp = tempfile.mkstemp(dir=self.dataDir)
+            f = os.fdopen(fd, "wb")
+            marshal.dump(self._data(), f)
+            f.close()
+            os.rename(tmp, tmp + ".prycoverage")
+        except (IOError, OSError):
+            pass
+
+    def _data(self):
+        """
+            Returns the data recorded for the files run, in a form marshal can
+            write, to be passed from a subprocess to its parent. The parent's
+            reports and data files are written by covdata, which doesn't hold
+            hit counts or functions.
+        """
+        files = []
+        for f in self.fileDict.values():
+            if f.executed or f.called:
+                files.append((
+                    f.path, f.hash, f.executed.bits, list(f.arcs),
+                    dict([(l, ids.bits) for l, ids in f.contexts.items()]),
+                    f.hits, f.times, f.called.bits
+                ))
+        return self.contextNames, files
+
+    def _addData(self, data):
+        """
+            Add data returned by _data in another process to fileDict, after
+            the context ids of this one. Files that are not covered, or whose
+            source hash differs, are ignored.
+        """
+        contextNames, files = data
+        offset = len(self.contextNames)
+        self.contextNames.extend(contextNames)
+        for path, h, executed, arcs, contexts, hits, times, called in files:
+            f = self.fileDict.get(path)
+            if f is None or f.hash != h:
+                continue
+            f.executed.bits |= executed
+            f.arcs.update(arcs)
+            for line, ids in contexts.items():
+                f.contexts.setdefault(line, LineSet()).bits |= ids << offset
+            _addCounts(f.hits, hits)
+            _addCounts(f.times, times)
+            f.called.bits |= called
+
+    def _mergeThreads(self):
+        """
+            OR the lines recorded by thread recorders into fileDict. Recorders
+            only ever add lines, so this can be done repeatedly, and while
+            they are still running. Hit counts and times are added, and then
+            cleared in place.
+        """
+        for r in self._recorders[:]:
+            for path, lines in r.lines.items():
+                self.fileDict[path].executed |= lines
+            for path, (hits, times) in r.hitData.items():
+                f = self.fileDict[path]
+                for d, counts in ((f.hits, hits), (f.times, times)):
+                    _addCounts(d, counts)
+                    counts.clear()
+
+    def _sampleFrames(self, frames):
+        """
+            Record the current lines of frames, and of the frames they were
+            called from.
+        """
+        for frame in frames:
+            while frame is not None:
+                code = frame.f_code
+                entry = self._codeCache.get(id(code)) or self._classify(code)
+                remaining, lineno = entry[2], frame.f_lineno
+                if remaining and lineno in remaining:
+                    remaining.discard(lineno)
+                    entry[1].add(lineno)
+                frame = frame.f_back
+
+    def _mergeFunctions(self):
+        """
+            Add the lines recorded in functions mode to the called lines of
+            their Files. Threads may still be recording, so each set is
+            copied first, and the sets are never emptied - adding the same
+            lines again does nothing.
+        """
+        for path, lines in self._calledLines.items():
+            self.fileDict[path].called.update(lines.copy())
+
+    def switchContext(self, name):
+        """
+            Attribute lines run from now on to the named context, or to no
+            context if name is None. Does nothing unless context mode is on.
+        """
+        if not self.contexts:
+            return
+        self._flushContext()
+        if name is None:
+            self._context = None
+        else:
+            self._context = len(self.contextNames)
+            self.contextNames.append(name)
+
+    def _flushContext(self):
+        """
+            Move the lines recorded for the current context into the Files.
+            The LineSets are emptied in place, since frames that are still
+            running may hold on to them.
+        """
+        flushed = False
+        for path, lines in self._contextLines.items():
+            if not lines:
+                continue
+            f = self.fileDict[path]
+            f.executed |= lines
+            if self._context is not None:
+                for l in lines:
+                    f.contexts.setdefault(l, LineSet()).add(self._context)
+            lines.bits = 0
+            flushed = True
+        if flushed:
+            self._codeCache.clear()
+
+    def whoCovers(self, path, line):
+        """
+            Returns a sorted list of the names of contexts that ran a line.
+        """
+        f = self.fileDict.get(os.path.abspath(path))
+        if not f:
+            return []
+        ids = f.contexts.get(line, ())
+        return sorted(set([self.contextNames[i] for i in ids]))
+
+    def uniqueLines(self):
+        """
+            Returns a sorted list of (path, line, context name) tuples, for
+            lines that were run by exactly one context.
+        """
+        lst = []
+        for f in self.fileDict.values():
+            for line, ids in f.contexts.items():
+                names = set([self.contextNames[i] for i in ids])
+                if len(names) == 1:
+                    lst.append((f.path, line, names.pop()))
+        lst.sort()
+        return lst
+
     def getGlobalStats(self):
         """
             Returns a dictionary of statistics covering all files.
@@ -258,7 +1254,8 @@ class Coverage:
             "-----------------------\n",
         ]
         files = self.fileDict.values()
-        files.sort()
+        # Equivalent to File.__cmp__, but works out each percentage once.
+        files.sort(key=lambda f: (-f.percentage, f.path))
         for f in files:
             lst.append(
                 "[%-4s] [%-4s] [%-6.5s%%]     %s  \n" % (
@@ -277,6 +1274,17 @@ class Coverage:
                     )
                 )
                 lst.append("\n")
+            if self.branches and f.missingArcs:
+                arcs = ["%s->%s"%(a, "exit" if b < 0 else b)
+                            for a, b in sorted(f.missingArcs)]
+                lst.append(
+                    f.prettyRanges(
+                        ["branches:"] + arcs,
+                        28,
+                        utils.terminalWidth()
+                    )
+                )
+                lst.append("\n")
         lst.append("-----------------------\n")
         s = self.getGlobalStats()
         lst.append("[%-4s] [%-4s] [%-6.5s%%]\n"%(
@@ -285,4 +1293,263 @@ class Coverage:
                         s["percentage"],
                     )
                 )
+        if self.branches:
+            possible = taken = 0
+            for f in files:
+                arcs = f.possibleArcs
+                possible += len(arcs)
+                taken += len(arcs & f.arcs)
+            lst.append("Branches: %s of %s taken\n"%(taken, possible))
+        if self.sample:
+            lst.append(
+                "Sampled every %.0fms: results are approximate.\n"%(
+                    self.sample*1000
+                )
+            )
         return "".join(lst)
+
+    def diffReport(self, changed):
+        """
+            A report on the coverage of changed lines only. Changed maps
+            paths to LineSets of changed lines, like the result of
+            gitdiff.changedLines. Only files that have changed are analysed.
+        """
+        lst = [
+            "[tot ] [run ] [percent]\n",
+            "-----------------------\n",
+        ]
+        real = dict(
+            [(os.path.realpath(p), f) for p, f in self.fileDict.items()]
+        )
+        rows = []
+        for path, lines in changed.items():
+            f = real.get(os.path.realpath(path))
+            if f is None:
+                continue
+            lines = lines & f.executable
+            if lines:
+                missed = lines - f.executed
+                perc = (len(lines) - len(missed))*100.0/len(lines)
+                rows.append((-perc, f.path, f, lines, missed))
+        rows.sort()
+        total = run = 0
+        for perc, path, f, lines, missed in rows:
+            total += len(lines)
+            run += len(lines) - len(missed)
+            lst.append(
+                "[%-4s] [%-4s] [%-6.5s%%]     %s  \n" % (
+                    len(lines),
+                    len(lines) - len(missed),
+                    -perc,
+                    f.nicePath(self.coveragePath),
+                )
+            )
+            if missed:
+                lst.append(
+                    f.prettyRanges(
+                        utils.summariseList(list(missed)),
+                        28,
+                        utils.terminalWidth()
+                    )
+                )
+                lst.append("\n")
+        lst.append("-----------------------\n")
+        lst.append("[%-4s] [%-4s] [%-6.5s%%]\n"%(
+                        total,
+                        run,
+                        run*100.0/total if total else 100.0,
+                    )
+                )
+        return "".join(lst)
+
+    def functionReport(self):
+        """
+            A report on the functions called in each file, in functions mode,
+            listing the names of the functions that were not.
+        """
+        self._mergeFunctions()
+        lst = [
+            "[tot ] [run ] [percent]\n",
+            "-----------------------\n",
+        ]
+        rows = []
+        total = run = 0
+        for f in self.fileDict.values():
+            n = len(f.functions)
+            missed = f.notCalled
+            perc = (n - len(missed))*100.0/n if n else 100.0
+            rows.append((-perc, f.path, f, n, missed))
+            total += n
+            run += n - len(missed)
+        rows.sort()
+        for perc, path, f, n, missed in rows:
+            lst.append(
+                "[%-4s] [%-4s] [%-6.5s%%]     %s  \n" % (
+                    n, n - len(missed), -perc, f.nicePath(self.coveragePath),
+                )
+            )
+            if missed:
+                lst.append(
+                    f.prettyRanges(missed, 28, utils.terminalWidth())
+                )
+                lst.append("\n")
+        lst.append("-----------------------\n")
+        lst.append("[%-4s] [%-4s] [%-6.5s%%]\n"%(
+                        total,
+                        run,
+                        run*100.0/total if total else 100.0,
+                    )
+                )
+        return "".join(lst)
+
+    def heatmapReport(self, top=10):
+        """
+            A report on the hottest lines of each file, in hits mode. Files
+            are listed in order of the total time spent in them.
+        """
+        self._mergeThreads()
+        rows = []
+        for f in self.fileDict.values():
+            if f.times:
+                rows.append((-sum(f.times.values()), f.path, f))
+        rows.sort()
+        lst = []
+        for total, path, f in rows:
+            lst.append(
+                "%9.6fs  %s\n"%(-total, f.nicePath(self.coveragePath))
+            )
+            for t, hits, line in f.hottest(top):
+                lst.append("    %6s: %9.6fs %8s hits\n"%(line, t, hits))
+        return "".join(lst)
+
+
+class Session:
+    """
+        A coverage session shared by the directories of a test run.
+
+        Directories get their Coverage objects from coverage(). Directories
+        with the same root and exclude list share one Coverage object, and so
+        one set of File objects, and their results are reported together.
+        The expensive parts are shared between the rest: each distinct root
+        is searched for files once, each file is analysed once, through a
+        shared AnalysisCache, and the line tables of code objects are worked
+        out once. Only one member traces at a time - starting one stops the
+        member that was tracing, so that they never compete for
+        sys.settrace.
+    """
+    def __init__(self, dummy=False, cache=None, **options):
+        """
+            dummy   - Create dummy Coverage objects.
+            cache   - An AnalysisCache. If None, an in-memory cache is used.
+            options - Extra keyword arguments for Coverage.
+        """
+        self.dummy = dummy
+        self.cache = cache or AnalysisCache(None)
+        self.options = options
+        self._lineCache = {}
+        # Maps (path, excludeList) keys to the results of _findFiles.
+        self._files = {}
+        # Maps (path, excludeList) keys to Coverage objects.
+        self._coverage = {}
+        # The member that is tracing, if any.
+        self.active = None
+
+    def coverage(self, coveragePath, excludeList=[]):
+        """
+            Returns the Coverage object of this session for a root and
+            exclude list, creating it the first time it is asked for.
+        """
+        key = self._key(coveragePath, excludeList)
+        if key not in self._coverage:
+            self._coverage[key] = Coverage(
+                coveragePath, excludeList, self.dummy, self.cache,
+                session=self, **self.options
+            )
+        return self._coverage[key]
+
+    def _key(self, path, excludeList):
+        return (
+            os.path.abspath(path),
+            tuple(sorted([os.path.abspath(i) for i in excludeList]))
+        )
+
+    def findFiles(self, path, excludeList):
+        key = self._key(path, excludeList)
+        if key not in self._files:
+            self._files[key] = _findFiles(path, excludeList)
+        return self._files[key]
+
+    def _starting(self, cov):
+        if self.active and self.active is not cov:
+            self.active.stop()
+        self.active = cov
+
+    def _stopped(self, cov):
+        if self.active is cov:
+            self.active = None
+
+
+# begin nocover
+def startSubprocess():
+    """
+        Start recording coverage in a subprocess, if the environment names
+        the data directory of a parent Coverage run. Called by the
+        sitecustomize module that the parent puts on the PYTHONPATH. Returns
+        the Coverage object, or None.
+    """
+    d = os.environ.get(_subprocessEnv)
+    if not d:
+        return None
+    config = marshal.load(open(os.path.join(d, "config"), "rb"))
+    cachePath = config.pop("cache")
+    config["cache"] = AnalysisCache(cachePath) if cachePath else None
+    c = Coverage(subprocesses=True, **config)
+    c.dataDir = d
+    atexit.register(c._saveSubprocess)
+    c.start()
+    return c
+# end nocover
+
+
+class _ThreadRecorder(Coverage):
+    """
+        Records coverage for a single thread, into LineSets owned by the
+        recorder. Arcs in branch mode go straight into the shared File.arcs
+        sets, since adding to a set is atomic.
+    """
+    def __init__(self, parent):
+        Coverage.__init__(
+            self, None, branches=parent.branches, hits=parent.hits
+        )
+        self.parent = parent
+        self.fileDict = parent.fileDict
+        # Maps paths to the lines recorded by this thread.
+        self.lines = {}
+        # Maps paths to (hits, times) tuples, in hits mode.
+        self.hitData = {}
+
+    def _target(self, f):
+        return self.lines.setdefault(f.path, LineSet())
+
+    def _hitTarget(self, f):
+        return self.hitData.setdefault(f.path, ({}, {}))
+
+    # begin nocover
+    def _globalTrace(self, frame, event, arg):
+        if not self.parent.tracing:
+            sys.settrace(None)
+            return None
+        return Coverage._globalTrace(self, frame, event, arg)
+
+    def _branchTrace(self, frame, event, arg):
+        if not self.parent.tracing:
+            sys.settrace(None)
+            return None
+        return Coverage._branchTrace(self, frame, event, arg)
+
+    def _hitTrace(self, frame, event, arg):
+        if not self.parent.tracing:
+            sys.settrace(None)
+            return None
+        return Coverage._hitTrace(self, frame, event, arg)
+    # end nocover
@@ -0,0 +1,182 @@
+"""
+    Exporting coverage data in machine-readable formats.
+
+    Each exporter takes a coverage.Coverage object and an open file, and
+    writes one covered file at a time, straight from its LineSets, so that
+    nothing but the output for the current file is held in memory. Branch
+    data is included when the Coverage object is in branch mode.
+"""
+import os.path, json, time
+from xml.sax import saxutils
+
+
+def _hit(f):
+    return len(f.executable & f.executed)
+
+
+def _files(cov):
+    """
+        Yields the files of cov, sorted by directory and then name.
+    """
+    for path in sorted(cov.fileDict, key=os.path.split):
+        yield cov.fileDict[path]
+
+
+def _branches(cov, f):
+    """
+        Returns a sorted list of (line, [(dest, taken), ...]) tuples for the
+        branch lines of f that were executed.
+    """
+    if not cov.branches:
+        return []
+    d = {}
+    for a, b in f.possibleArcs:
+        if a in f.executed:
+            d.setdefault(a, []).append((b, (a, b) in f.arcs))
+    return sorted([(l, sorted(dests)) for l, dests in d.items()])
+
+
+def _branchCounts(branches):
+    """
+        Returns (taken, total) for the result of _branches.
+    """
+    taken = total = 0
+    for l, dests in branches:
+        total += len(dests)
+        taken += len([i for i in dests if i[1]])
+    return taken, total
+
+
+def _rate(n, total):
+    if total:
+        return "%.4f"%(float(n)/total)
+    return "1.0"
+
+
+def writeLCOV(cov, out):
+    """
+        Write an LCOV tracefile.
+    """
+    for f in _files(cov):
+        out.write("TN:\nSF:%s\n"%f.path)
+        for l in f.executable:
+            out.write("DA:%s,%s\n"%(l, 1 if l in f.executed else 0))
+        if cov.branches:
+            found = hit = 0
+            for l, dests in _branches(cov, f):
+                for i, (dest, taken) in enumerate(dests):
+                    found += 1
+                    hit += taken
+                    out.write("BRDA:%s,0,%s,%s\n"%(l, i, 1 if taken else 0))
+            out.write("BRF:%s\nBRH:%s\n"%(found, hit))
+        out.write(
+            "LF:%s\nLH:%s\nend_of_record\n"%(f.numExecutable, _hit(f))
+        )
+
+
+def writeCobertura(cov, out):
+    """
+        Write a Cobertura XML report. Each directory becomes a package, and
+        each file a class.
+    """
+    total = run = taken = arcs = 0
+    for f in cov.fileDict.values():
+        total += f.numExecutable
+        run += _hit(f)
+        t, a = _branchCounts(_branches(cov, f))
+        taken, arcs = taken + t, arcs + a
+    out.write('<?xml version="1.0" encoding="utf-8"?>\n')
+    out.write(
+        '<coverage line-rate="%s" branch-rate="%s" lines-covered="%s" '
+        'lines-valid="%s" version="pry" timestamp="%d">\n'%(
+            _rate(run, total), _rate(taken, arcs), run, total,
+            time.time()*1000
+        )
+    )
+    out.write(
+        "<sources><source>%s</source></sources>\n<packages>\n"%(
+            saxutils.escape(cov.coveragePath)
+        )
+    )
+    package = None
+    for f in _files(cov):
+        path = f.nicePath(cov.coveragePath)
+        d = os.path.dirname(path)
+        if d != package:
+            if package is not None:
+                out.write("</classes></package>\n")
+            package = d
+            out.write(
+                "<package name=%s><classes>\n"%saxutils.quoteattr(d or ".")
+            )
+        branches = _branches(cov, f)
+        out.write(
+            '<class name=%s filename=%s line-rate="%s" branch-rate="%s">'
+            '<methods/><lines>\n'%(
+                saxutils.quoteattr(os.path.basename(path)),
+                saxutils.quoteattr(path),
+                _rate(_hit(f), f.numExecutable),
+                _rate(*_branchCounts(branches)),
+            )
+        )
+        branches = dict(branches)
+        for l in f.executable:
+            attrs = 'number="%s" hits="%s"'%(l, 1 if l in f.executed else 0)
+            if l in branches:
+                taken, n = _branchCounts([(l, branches[l])])
+                attrs += ' branch="true" condition-coverage="%d%% (%s/%s)"'%(
+                    taken*100/n, taken, n
+                )
+            out.write("<line %s/>\n"%attrs)
+        out.write("</lines></class>\n")
+    if package is not None:
+        out.write("</classes></package>\n")
+    out.write("</packages>\n</coverage>\n")
+
+
+def writeJSON(cov, out):
+    """
+        Write a JSON document, with an object for each file and the totals.
+    """
+    out.write('{"root": %s, "files": {'%json.dumps(cov.coveragePath))
+    total = run = 0
+    for i, f in enumerate(_files(cov)):
+        d = dict(
+            executable=list(f.executable),
+            executed=list(f.executed & f.executable),
+            missing=list(f.notExecuted),
+            percentage=f.percentage,
+        )
+        if cov.branches:
+            d["missingBranches"] = sorted(f.missingArcs)
+        out.write(
+            "%s\n%s: %s"%(
+                "," if i else "", json.dumps(f.path), json.dumps(d)
+            )
+        )
+        total += f.numExecutable
+        run += f.numExecuted
+    totals = dict(
+        statementsRun=run,
+        allStatements=total,
+        percentage=run*100.0/total if total else 0,
+    )
+    out.write('\n}, "totals": %s}\n'%json.dumps(totals))
+
+
+formats = {
+    "lcov": writeLCOV,
+    "cobertura": writeCobertura,
+    "json": writeJSON,
+}
+
+
+def export(cov, format, path):
+    """
+        Write cov to path, in one of the formats named in formats.
+    """
+    out = open(path, "w")
+    try:
+        formats[format](cov, out)
+    finally:
+        out.close()
@@ -0,0 +1,223 @@
+"""
+    Writing annotated source, heatmap and HTML coverage reports to a
+    directory.
+
+    Each covered file gets a page, streamed to disk a line at a time from
+    the source file. When there are many pages to write, the work is spread
+    over a pool of processes. A manifest in the report directory records a
+    key for every page, built from the source hash and line sets of its
+    file, and pages whose key has not changed are not written again.
+"""
+import os, os.path, json, hashlib, cgi, urllib, multiprocessing
+import coverage
+from lineset import LineSet
+
+# Maps report formats to the extension of their pages.
+formats = {
+    "annotate": ".annotated",
+    "heatmap": ".heatmap",
+    "html": ".html",
+}
+
+# Change this when the page templates change, to invalidate old pages.
+_version = "1"
+
+_header = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>%s</title>
+<style>
+body { font-family: sans-serif; }
+pre { line-height: 1.3; }
+.miss { background: #fdd; }
+.run { background: #dfd; }
+.n { color: #999; }
+td { padding: 0 1em; }
+</style>
+</head>
+<body>
+"""
+
+
+def _summary(run, total):
+    perc = run*100.0/total if total else 100.0
+    return "%s of %s lines run (%.1f%%)"%(run, total, perc)
+
+
+def _writeHTML(path, title, executable, missed, out):
+    """
+        Write an HTML page for the source file at path to out, a line at a
+        time.
+    """
+    title = cgi.escape(title)
+    out.write(_header%title)
+    out.write("<h1>%s</h1>\n"%title)
+    out.write(
+        "<p>%s</p>\n<pre>"%_summary(
+            len(executable) - len(missed), len(executable)
+        )
+    )
+    f = open(path, "r")
+    try:
+        for i, l in enumerate(f):
+            n = i + 1
+            if n in missed:
+                cls = ' class="miss"'
+            elif n in executable:
+                cls = ' class="run"'
+            else:
+                cls = ""
+            out.write(
+                '<span%s><span class="n">%4d</span> %s</span>\n'%(
+                    cls, n, cgi.escape(l.rstrip("\r\n"))
+                )
+            )
+    finally:
+        f.close()
+    out.write("</pre>\n</body>\n</html>\n")
+
+
+def _writePage(job):
+    """
+        Write a single page. A job is a (format, source, page, title,
+        executable, missed, hits, times) tuple, with line sets given as the
+        longs backing them, so that it can be sent to pool workers. Returns
+        False if the page could not be written.
+    """
+    fmt, src, page, title, executable, missed, hits, times = job
+    try:
+        out = open(page, "w")
+        try:
+            if fmt == "html":
+                _writeHTML(
+                    src, title, LineSet(bits=executable),
+                    LineSet(bits=missed), out
+                )
+            elif fmt == "heatmap":
+                coverage._writeHeatmap(src, hits, times, out)
+            else:
+                coverage._writeAnnotation(src, LineSet(bits=missed), out)
+        finally:
+            out.close()
+    except (IOError, OSError):
+        return False
+    return True
+
+
+class Report:
+    """
+        A report directory, holding a page for each covered file. For HTML
+        reports, there is also an index page.
+    """
+    manifestName = ".pryreport"
+    minParallel = 100
+    def __init__(self, path, format="html"):
+        """
+            path    - The report directory.
+            format  - One of the keys of formats.
+        """
+        self.path = path
+        self.format = format
+        self.manifest = self._load()
+
+    def _load(self):
+        try:
+            return json.load(
+                open(os.path.join(self.path, self.manifestName))
+            )
+        except (IOError, ValueError):
+            return {}
+
+    def _key(self, f):
+        h = hashlib.sha1(_version)
+        parts = [f.hash, f.executable.tobytes(), f.notExecuted.tobytes()]
+        if self.format == "heatmap":
+            parts.extend([repr(sorted(f.hits.items())),
+                          repr(sorted(f.times.items()))])
+        for i in parts:
+            h.update("%s:%s"%(len(i), i))
+        return h.hexdigest()
+
+    def _run(self, jobs, processes):
+        if len(jobs) >= self.minParallel:
+            try:
+                pool = multiprocessing.Pool(processes)
+            except (OSError, ImportError):
+                pass
+            else:
+                try:
+                    return pool.map(_writePage, jobs)
+                finally:
+                    pool.close()
+                    pool.join()
+        return [_writePage(j) for j in jobs]
+
+    def write(self, cov, processes=None):
+        """
+            Write the pages of the files of cov that have changed since the
+            last report, and remove pages of files that are no longer
+            covered. Returns a list of the pages written.
+        """
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+        files, manifest, names, jobs = [], {}, [], []
+        for f in cov.fileDict.values():
+            name = f.nicePath(cov.coveragePath) + formats[self.format]
+            page = os.path.join(self.path, name)
+            files.append((name, f))
+            manifest[name] = self._key(f)
+            if self.manifest.get(name) != manifest[name] or\
+                not os.path.exists(page):
+                d = os.path.dirname(page)
+                if not os.path.isdir(d):
+                    os.makedirs(d)
+                names.append(name)
+                jobs.append(
+                    (
+                        self.format, f.path, page,
+                        f.nicePath(cov.coveragePath),
+                        f.executable.bits, f.notExecuted.bits,
+                        f.hits, f.times
+                    )
+                )
+        for name in set(self.manifest) - set(manifest):
+            try:
+                os.remove(os.path.join(self.path, name))
+            except OSError:
+                pass
+        written = []
+        for name, job, ok in zip(names, jobs, self._run(jobs, processes)):
+            if ok:
+                written.append(job[2])
+            else:
+                del manifest[name]
+        if self.format == "html":
+            self._writeIndex(sorted(files))
+        f = open(os.path.join(self.path, self.manifestName), "w")
+        json.dump(manifest, f)
+        f.close()
+        self.manifest = manifest
+        return written
+
+    def _writeIndex(self, files):
+        out = open(os.path.join(self.path, "index.html"), "w")
+        try:
+            out.write(_header%"Coverage")
+            out.write("<h1>Coverage</h1>\n<table>\n")
+            run = total = 0
+            for name, f in files:
+                n = len(f.executable - f.notExecuted)
+                run += n
+                total += f.numExecutable
+                out.write(
+                    '<tr><td><a href="%s">%s</a></td><td>%s</td></tr>\n'%(
+                        cgi.escape(urllib.quote(name), True),
+                        cgi.escape(name[:-len(formats[self.format])]),
+                        _summary(n, f.numExecutable)
+                    )
+                )
+            out.write("</table>\n<p>%s</p>\n"%_summary(run, total))
+            out.write("</body>\n</html>\n")
+        finally:
+            out.close()
@@ -0,0 +1,109 @@
+"""
+    Choosing tests from per-test coverage data, recorded in context mode.
+
+    Each test's lines, across all files, are packed into a single LineSet,
+    with every file given its own range of bits. Both selections are greedy.
+    The number of new lines each test would add is kept up to date through
+    an index from lines to the tests that run them: choosing a test only
+    touches the tests that share lines with it, so a selection costs time
+    proportional to the total size of the tests, rather than to the number
+    of tests times the size of the suite. Tests wait on a heap, and a test
+    whose score has fallen since it was pushed is pushed back with its new
+    score when it reaches the top.
+"""
+import heapq, json
+from lineset import LineSet
+
+
+def testLines(cov):
+    """
+        Returns a dictionary mapping the names of the contexts of cov to
+        LineSets of the lines they ran, numbered across all files. Contexts
+        with the same name, from combined runs, are merged.
+    """
+    # Line numbers are gathered in lists first, since adding to a LineSet
+    # one member at a time copies the whole bitmap every time.
+    byName = {}
+    offset = 0
+    for path in sorted(cov.fileDict):
+        f = cov.fileDict[path]
+        top = 0
+        for line, ids in f.contexts.items():
+            top = max(top, line)
+            n = offset + line
+            for i in ids:
+                byName.setdefault(cov.contextNames[i], []).append(n)
+        offset += top + 1
+    return dict([(name, LineSet(l)) for name, l in byName.items()])
+
+
+def _greedy(tests, score):
+    """
+        Repeatedly choose the test with the highest score(new lines, name),
+        until no test adds new lines. Returns a list of (name, new lines)
+        tuples, in the order chosen.
+    """
+    members, gain, byLine = {}, {}, {}
+    for name, lines in tests.items():
+        members[name] = list(lines)
+        gain[name] = len(members[name])
+        for l in members[name]:
+            byLine.setdefault(l, []).append(name)
+    heap = [(-score(g, n), n) for n, g in gain.items() if g]
+    heapq.heapify(heap)
+    covered = set()
+    chosen = []
+    while heap:
+        s, name = heapq.heappop(heap)
+        new = gain[name]
+        if not new:
+            continue
+        current = (-score(new, name), name)
+        if current != (s, name):
+            heapq.heappush(heap, current)
+            continue
+        for l in members[name]:
+            if l not in covered:
+                covered.add(l)
+                for t in byLine[l]:
+                    gain[t] -= 1
+        chosen.append((name, new))
+    return chosen
+
+
+def minimize(tests):
+    """
+        Returns a list of (name, new lines) tuples for a subset of tests that
+        runs every line the whole set does. The set cover problem is NP-hard,
+        and the greedy choice is within a factor of ln(lines) of the optimum.
+    """
+    return _greedy(tests, lambda new, name: new)
+
+
+def prioritize(tests, times):
+    """
+        Returns a list of (name, new lines) tuples for all tests, ordered so
+        that the tests adding the most new lines per second of run time come
+        first. Times maps test names to durations. Tests without a duration
+        are assumed to take the mean duration. Tests that add nothing come
+        last, fastest first.
+    """
+    known = [times[n] for n in tests if n in times]
+    mean = sum(known)/len(known) if known else 1.0
+    def duration(name):
+        return max(times.get(name, mean), 1e-6)
+    chosen = _greedy(tests, lambda new, name: new/duration(name))
+    rest = set(tests) - set([n for n, new in chosen])
+    rest = sorted(rest, key=lambda n: (duration(n), n))
+    return chosen + [(n, 0) for n in rest]
+
+
+def readTimes(path):
+    """
+        Read the test durations recorded by the progress output, returning
+        an empty dictionary if there are none.
+    """
+    try:
+        return json.load(open(path))
+    except (IOError, ValueError):
+        return {}
@@ -1,7 +1,220 @@
 """
     A module for printing "nice" messages from assertion statements.
 """
-import tokenize, parser
+import tokenize, parser, itertools
+import repr as _reprlib
+
+
+class _BoundedRepr(_reprlib.Repr):
+    """
+        A Repr that never does work proportional to the size of a container.
+        The standard Repr sorts sets and dicts before truncating them, and
+        falls back to a full repr for unicode and container subclasses.
+    """
+    def __init__(self):
+        _reprlib.Repr.__init__(self)
+        self.maxlevel = 4
+        self.maxtuple = self.maxlist = self.maxdeque = 20
+        self.maxset = self.maxfrozenset = 20
+        self.maxarray = 20
+        self.maxdict = 10
+        self.maxstring = self.maxother = 160
+        self.maxlong = 100
+
+    def repr1(self, x, level):
+        typename = "repr_" + "_".join(type(x).__name__.split())
+        if not hasattr(self, typename):
+            # Subclasses of builtin types that don't have their own __repr__
+            for t in (dict, list, tuple, set, frozenset, str, unicode):
+                if isinstance(x, t) and type(x).__repr__ is t.__repr__:
+                    return getattr(self, "repr_" + t.__name__)(x, level)
+        return _reprlib.Repr.repr1(self, x, level)
+
+    def repr_set(self, x, level):
+        return self._repr_iterable(x, level, "set([", "])", self.maxset)
+
+    def repr_frozenset(self, x, level):
+        return self._repr_iterable(
+                    x, level, "frozenset([", "])", self.maxfrozenset
+                )
+
+    def repr_unicode(self, x, level):
+        s = repr(x[:self.maxstring])
+        if len(x) > self.maxstring:
+            s = s[:-1] + "..." + s[-1]
+        return s
+
+    def repr_dict(self, x, level):
+        if not x:
+            return "{}"
+        if level <= 0:
+            return "{...}"
+        pieces = []
+        for k, v in itertools.islice(x.iteritems(), self.maxdict):
+            pieces.append(
+                "%s: %s"%(self.repr1(k, level-1), self.repr1(v, level-1))
+            )
+        if len(x) > self.maxdict:
+            pieces.append("...")
+        return "{%s}"%", ".join(pieces)
+
+
+def saferepr(obj):
+    """
+        Return a size-bounded representation of obj. Never raises.
+    """
+    try:
+        return _BoundedRepr().repr(obj)
+    except Exception, v:
+        return "<unrepresentable %s: %s>"%(
+                    type(obj).__name__, v.__class__.__name__
+                )
+
+
+class _Differ:
+    """
+        Describes the differences between two objects that compared unequal.
+
+        At most budget elements are examined, and at most limit differences
+        are shown, so the cost is capped regardless of operand size.
+    """
+    budget = 1000000
+    limit = 5
+    _chunk = 4096
+    def __init__(self, left, right):
+        self.left, self.right = left, right
+
+    def lines(self):
+        l, r = self.left, self.right
+        if isinstance(l, basestring) and isinstance(r, basestring):
+            return self.strings(l, r)
+        elif isinstance(l, dict) and isinstance(r, dict):
+            return self.dicts(l, r)
+        elif isinstance(l, (set, frozenset)) and\
+            isinstance(r, (set, frozenset)):
+            return self.sets(l, r)
+        elif isinstance(l, (list, tuple)) and isinstance(r, (list, tuple)):
+            return self.sequences(l, r)
+        return []
+
+    def _lengths(self, l, r):
+        if len(l) != len(r):
+            return ["lengths differ: %s != %s"%(len(l), len(r))]
+        return []
+
+    def _count(self, n, scanned, what):
+        s = "%s differing %s"%(n, what)
+        if not scanned:
+            s += " (comparison stopped after %s elements)"%self.budget
+        return s
+
+    def strings(self, l, r):
+        lst = self._lengths(l, r)
+        # Compare chunk by chunk to find the first difference without
+        # copying the whole string.
+        n = min(len(l), len(r))
+        pos = None
+        for off in xrange(0, min(n, self.budget), self._chunk):
+            if l[off:off+self._chunk] != r[off:off+self._chunk]:
+                for i in xrange(off, min(off+self._chunk, n)):
+                    if l[i] != r[i]:
+                        pos = i
+                        break
+                break
+        if pos is None:
+            if n > self.budget:
+                lst.append("no difference in first %s characters"%self.budget)
+                return lst
+            pos = n
+        line = l.count("\n", 0, pos) + 1
+        col = pos - (l.rfind("\n", 0, pos) + 1)
+        lst.append(
+            "first difference at index %s (line %s, column %s):"%(
+                pos, line, col
+            )
+        )
+        start = max(0, pos - 20)
+        lst.append("  %s"%saferepr(l[start:pos+40]))
+        lst.append("  %s"%saferepr(r[start:pos+40]))
+        return lst
+
+    def sequences(self, l, r):
+        lst = self._lengths(l, r)
+        shown, count, scanned = [], 0, True
+        for i, (a, b) in enumerate(itertools.izip(l, r)):
+            if i >= self.budget:
+                scanned = False
+                break
+            if a != b:
+                count += 1
+                if len(shown) < self.limit:
+                    shown.append(
+                        "  [%s]: %s != %s"%(i, saferepr(a), saferepr(b))
+                    )
+        if shown:
+            lst.append("first differing items:")
+            lst.extend(shown)
+            lst.append(self._count(count, scanned, "items"))
+        return lst
+
+    def _missing(self, l, r, label):
+        """
+            Report the members of l that are not in r.
+        """
+        shown, count, scanned = [], 0, True
+        for i, k in enumerate(l):
+            if i >= self.budget:
+                scanned = False
+                break
+            if k not in r:
+                count += 1
+                if len(shown) < self.limit:
+                    shown.append(saferepr(k))
+        if shown:
+            return [
+                "%s: %s"%(label, ", ".join(shown)),
+                self._count(count, scanned, "items " + label)
+            ]
+        return []
+
+    def sets(self, l, r):
+        lst = self._lengths(l, r)
+        lst.extend(self._missing(l, r, "only on left"))
+        lst.extend(self._missing(r, l, "only on right"))
+        return lst
+
+    def dicts(self, l, r):
+        lst = self.sets(l, r)
+        shown, count, scanned = [], 0, True
+        for i, (k, v) in enumerate(l.iteritems()):
+            if i >= self.budget:
+                scanned = False
+                break
+            if k in r and r[k] != v:
+                count += 1
+                if len(shown) < self.limit:
+                    shown.append(
+                        "  [%s]: %s != %s"%(
+                            saferepr(k), saferepr(v), saferepr(r[k])
+                        )
+                    )
+        if shown:
+            lst.append("differing values:")
+            lst.extend(shown)
+            lst.append(self._count(count, scanned, "values"))
+        return lst
+
+
+def diff(left, right):
+    """
+        Returns a list of lines describing how left differs from right. The
+        list is empty if there is nothing useful to say.
+    """
+    try:
+        return _Differ(left, right).lines()
+    except Exception:
+        return []
+
 
 class _Wrap:
     def __init__(self, *lines):
@@ -20,9 +233,10 @@ class Expression:
 
     def show(self, glob, loc):
         try:
-            return repr(eval(self.s, glob, loc))
+            self.value = eval(self.s, glob, loc)
         except SyntaxError, v:
             return "<could not be evaluated>"
+        return saferepr(self.value)
 
     def __eq__(self, other):
         return self.s == other.s
@@ -91,4 +305,41 @@ class Explain:
                 l.append(i.show(self.glob, self.loc))
             else:
                 l.append(i)
-        return " ".join(l)
+        s = " ".join(l)
+        p = self.parsed
+        if len(p) == 3 and p[1] == "==" and\
+            hasattr(p[0], "value") and hasattr(p[2], "value"):
+            s += _diffLines(p[0].value, p[2].value)
+        return s
+
+
+def _diffLines(left, right):
+    return "".join(["\n    :: %s"%i for i in diff(left, right)])
+
+
+class Captured:
+    """
+        An explanation built from the operand values captured by a rewritten
+        assertion.
+    """
+    def __init__(self, expr, parts, diffs=()):
+        """
+            :expr The source of the assertion expression.
+            :parts The rendered expression, as a list of strings.
+            :diffs A list of (left, right) pairs of values that were found to
+            be unequal.
+        """
+        # Discard the message clause, if we can find it.
+        self.expr = Explain().parseExpression(expr)[1] or expr
+        self.parts, self.diffs = parts, diffs
+
+    def __str__(self):
+        l = []
+        l.append("    :: Captured values:\n")
+        l.append("   :: %s\n"%self.expr)
+        l.append("   ::")
+        l.extend(self.parts)
+        s = " ".join(l)
+        for left, right in self.diffs:
+            s += _diffLines(left, right)
+        return s
@@ -0,0 +1,63 @@
+"""
+    Finding the lines that have changed since a git revision, for reports on
+    the coverage of changed lines.
+"""
+import os.path, re, subprocess
+from lineset import LineSet
+
+_hunkRe = re.compile(r"@@ -\d+(?:,\d+)? \+(\d+)(?:,(\d+))? @@")
+
+
+def parse(diff, root):
+    """
+        Parse the output of "git diff -U0", with paths relative to root.
+        Returns a dictionary mapping the real paths of changed files to
+        LineSets of the lines added or changed in the new version. Deleted
+        files are left out.
+    """
+    changed = {}
+    lines = None
+    for l in diff.splitlines():
+        if l.startswith("+++ "):
+            p = l[4:].rstrip("\t")
+            if p.startswith("b/"):
+                p = os.path.realpath(os.path.join(root, p[2:]))
+                lines = changed.setdefault(p, LineSet())
+            else:
+                lines = None
+        elif l.startswith("@@ ") and lines is not None:
+            m = _hunkRe.match(l)
+            start = int(m.group(1))
+            count = 1 if m.group(2) is None else int(m.group(2))
+            lines.update(range(start, start + count))
+    return changed
+
+
+def _git(path, *args):
+    try:
+        p = subprocess.Popen(
+            ("git",) + args,
+            cwd=path,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE
+        )
+    except OSError, v:
+        raise ValueError("Could not run git: %s"%v)
+    out, err = p.communicate()
+    if p.returncode:
+        raise ValueError("git %s failed: %s"%(args[0], err.strip()))
+    return out
+
+
+def changedLines(base, path="."):
+    """
+        Returns the lines changed between the git revision base and the
+        working tree of the repository containing path, in the format
+        returned by parse. Untracked files are not included.
+    """
+    root = _git(path, "rev-parse", "--show-toplevel").strip()
+    diff = _git(
+        path, "diff", "--no-color", "--no-ext-diff", "-U0",
+        "--src-prefix=a/", "--dst-prefix=b/", base, "--"
+    )
+    return parse(diff, root)
@@ -0,0 +1,141 @@
+"""
+    A compact set of line numbers, stored as a bitmap.
+"""
+import binascii, re
+
+_nonzero = re.compile("[^\x00]")
+
+
+class LineSet(object):
+    """
+        A set of non-negative integers, stored as the bits of a Python long.
+        Bit n is set if n is a member.
+
+        Union, intersection and difference are single operations on longs,
+        which makes merging line sets cheap, and a set of lines takes one bit
+        per line rather than a few dozen bytes per member. LineSet supports
+        the parts of the set interface used for coverage data, and compares
+        equal to sets with the same members.
+
+        Since longs are immutable, add and discard build a new long the size
+        of the whole set. To make a set from many members, pass them all to
+        the constructor, which sets their bits in a bytearray and converts it
+        to a long once.
+    """
+    __slots__ = ("bits",)
+    __hash__ = None
+    def __init__(self, lines=(), bits=0):
+        lines = list(lines)
+        if lines:
+            if min(lines) < 0:
+                raise ValueError("negative LineSet member")
+            buf = bytearray((max(lines) >> 3) + 1)
+            for i in lines:
+                buf[i >> 3] |= 1 << (i & 7)
+            bits |= self.frombytes(str(buf)).bits
+        self.bits = bits
+
+    @classmethod
+    def frombytes(klass, data):
+        """
+            Make a LineSet from a string in which bit n of byte i is set if
+            line i*8 + n is a member.
+        """
+        return klass(bits=long(binascii.hexlify(data[::-1]) or "0", 16))
+
+    def tobytes(self):
+        """
+            The inverse of frombytes. An empty set gives an empty string.
+        """
+        if not self.bits:
+            return ""
+        h = "%x"%self.bits
+        if len(h)%2:
+            h = "0" + h
+        return binascii.unhexlify(h)[::-1]
+
+    def _bits(self, other):
+        if isinstance(other, LineSet):
+            return other.bits
+        return LineSet(other).bits
+
+    def add(self, n):
+        self.bits |= 1 << n
+
+    def discard(self, n):
+        self.bits &= ~(1 << n)
+
+    def update(self, other):
+        self.bits |= self._bits(other)
+
+    def pop(self):
+        """
+            Remove and return the smallest member.
+        """
+        if not self.bits:
+            raise KeyError("pop from an empty LineSet")
+        low = self.bits & -self.bits
+        self.bits ^= low
+        # low is a power of two, so its binary form is "0b1" and then zeros.
+        return len(bin(low)) - 3
+
+    def copy(self):
+        return LineSet(bits=self.bits)
+
+    def __contains__(self, n):
+        return bool((self.bits >> n) & 1)
+
+    def __iter__(self):
+        # The regular expression skips runs of empty bytes in C, so sparse
+        # sets are iterated in time proportional to their members.
+        for m in _nonzero.finditer(self.tobytes()):
+            i, c = m.start(), ord(m.group())
+            for j in range(8):
+                if c & (1 << j):
+                    yield i*8 + j
+
+    def __len__(self):
+        return bin(self.bits).count("1")
+
+    def __nonzero__(self):
+        return bool(self.bits)
+
+    def __or__(self, other):
+        return LineSet(bits=self.bits | self._bits(other))
+    __ror__ = __or__
+
+    def __and__(self, other):
+        return LineSet(bits=self.bits & self._bits(other))
+    __rand__ = __and__
+
+    def __sub__(self, other):
+        return LineSet(bits=self.bits & ~self._bits(other))
+
+    def __rsub__(self, other):
+        return LineSet(bits=self._bits(other) & ~self.bits)
+
+    def __ior__(self, other):
+        self.bits |= self._bits(other)
+        return self
+
+    def __eq__(self, other):
+        try:
+            return self.bits == self._bits(other)
+        except TypeError:
+            return NotImplemented
+
+    def __ne__(self, other):
+        eq = self.__eq__(other)
+        if eq is NotImplemented:
+            return eq
+        return not eq
+
+    def __le__(self, other):
+        return not self.bits & ~self._bits(other)
+
+    def __ge__(self, other):
+        o = self._bits(other)
+        return not o & ~self.bits
+
+    def __repr__(self):
+        return "LineSet(%r)"%list(self)
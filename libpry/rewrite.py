@@ -0,0 +1,299 @@
+"""
+    An import hook that rewrites assert statements in test modules.
+
+    Each assertion is expanded so that the operands of comparisons and
+    boolean operators are stored in temporary variables as they are computed.
+    Nothing else happens unless the assertion fails, in which case the
+    captured values are used to build an explanation. This means that failing
+    expressions are never re-evaluated, so side effects are not repeated and
+    the values shown are exactly the values that were tested.
+"""
+import sys, os.path, imp, ast
+import explain
+
+# Prefix for temporary names. The "@" makes these impossible to clash with
+# names in the rewritten source.
+_TMP = "@pry_"
+_MODNAME = "@pry_rewrite"
+
+_cmpOps = {
+    ast.Eq: "==",
+    ast.NotEq: "!=",
+    ast.Lt: "<",
+    ast.LtE: "<=",
+    ast.Gt: ">",
+    ast.GtE: ">=",
+    ast.Is: "is",
+    ast.IsNot: "is not",
+    ast.In: "in",
+    ast.NotIn: "not in",
+}
+
+
+def _const(obj):
+    """
+        Turn a nested structure of tuples, lists and strings into an AST
+        expression.
+    """
+    if isinstance(obj, (tuple, list)):
+        return ast.Tuple([_const(i) for i in obj], ast.Load())
+    return ast.Str(obj)
+
+
+def _name(name, ctx=None):
+    return ast.Name(name, ctx or ast.Load())
+
+
+def _assign(name, value):
+    return ast.Assign([_name(name, ast.Store())], value)
+
+
+class _AssertRewriter(ast.NodeTransformer):
+    def __init__(self):
+        self.counter = 0
+
+    def _temp(self):
+        self.counter += 1
+        return "%s%s"%(_TMP, self.counter)
+
+    def visit_Module(self, node):
+        self.generic_visit(node)
+        # The helper import goes after the docstring and any __future__
+        # imports.
+        pos = 0
+        for i, stmt in enumerate(node.body):
+            if i == 0 and isinstance(stmt, ast.Expr) and\
+                isinstance(stmt.value, ast.Str):
+                pos = 1
+            elif isinstance(stmt, ast.ImportFrom) and\
+                stmt.module == "__future__":
+                pos = i + 1
+            else:
+                break
+        helper = ast.Import([ast.alias("libpry.rewrite", _MODNAME)])
+        helper.lineno, helper.col_offset = 1, 0
+        node.body.insert(pos, helper)
+        return node
+
+    def visit_Assert(self, node):
+        body = []
+        name, spec = self._expr(node.test, body)
+        args = [_const(spec)]
+        if node.msg:
+            args.append(node.msg)
+        fail = ast.Raise(
+            ast.Call(
+                ast.Attribute(_name(_MODNAME), "_fail", ast.Load()),
+                args, [], None, None
+            ),
+            None,
+            None
+        )
+        body.append(
+            ast.If(ast.UnaryOp(ast.Not(), _name(name)), [fail], [])
+        )
+        for i in body:
+            for j in ast.walk(i):
+                if "lineno" in j._attributes and not hasattr(j, "lineno"):
+                    j.lineno, j.col_offset = node.lineno, node.col_offset
+        return body
+
+    def _expr(self, node, body):
+        """
+            Append statements that evaluate node to body. Returns a (name,
+            spec) tuple, where name is the temporary holding the result, and
+            spec describes the structure of the expression for _fail.
+        """
+        if isinstance(node, ast.BoolOp):
+            return self._boolop(node, body)
+        elif isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+            sub, spec = self._expr(node.operand, body)
+            res = self._temp()
+            body.append(_assign(res, ast.UnaryOp(ast.Not(), _name(sub))))
+            return res, ("not", spec)
+        elif isinstance(node, ast.Compare):
+            return self._compare(node, body)
+        else:
+            res = self._temp()
+            body.append(_assign(res, node))
+            return res, ("leaf", res)
+
+    def _boolop(self, node, body):
+        op = "and" if isinstance(node.op, ast.And) else "or"
+        res = self._temp()
+        specs = []
+        for i, v in enumerate(node.values):
+            sub, spec = self._expr(v, body)
+            specs.append(spec)
+            body.append(_assign(res, _name(sub)))
+            if i < len(node.values) - 1:
+                test = _name(res)
+                if op == "or":
+                    test = ast.UnaryOp(ast.Not(), test)
+                nxt = ast.If(test, [], [])
+                body.append(nxt)
+                body = nxt.body
+        return res, ("bool", op, specs)
+
+    def _compare(self, node, body):
+        prev, left = self._expr(node.left, body)
+        res = self._temp()
+        links = []
+        for i, (op, comp) in enumerate(zip(node.ops, node.comparators)):
+            sub, spec = self._expr(comp, body)
+            link = self._temp()
+            body.append(
+                _assign(
+                    link,
+                    ast.Compare(_name(prev), [op], [_name(sub)])
+                )
+            )
+            body.append(_assign(res, _name(link)))
+            links.append((_cmpOps[op.__class__], spec, link))
+            if i < len(node.ops) - 1:
+                nxt = ast.If(_name(link), [], [])
+                body.append(nxt)
+                body = nxt.body
+            prev = sub
+        return res, ("cmp", left, links)
+
+
+def rewrite(source, filename):
+    """
+        Compile source, rewriting all assert statements. Returns a code
+        object.
+    """
+    tree = ast.parse(source, filename)
+    tree = _AssertRewriter().visit(tree)
+    return compile(tree, filename, "exec", 0, True)
+
+
+def _paren(spec, values, diffs):
+    parts = _render(spec, values, diffs)
+    if spec[0] != "leaf":
+        parts[0] = "(" + parts[0]
+        parts[-1] = parts[-1] + ")"
+    return parts
+
+
+def _render(spec, values, diffs):
+    """
+        Walk an expression spec, following the control flow of the original
+        expression, and return a list of strings describing it. The operands
+        of failed equality comparisons are appended to diffs.
+    """
+    kind = spec[0]
+    if kind == "leaf":
+        return [explain.saferepr(values[spec[1]])]
+    elif kind == "not":
+        return ["not"] + _paren(spec[1], values, diffs)
+    elif kind == "bool":
+        op, subs = spec[1], spec[2]
+        parts = []
+        evaluated = True
+        for i, sub in enumerate(subs):
+            if i:
+                parts.append(op)
+            if evaluated:
+                parts.extend(_paren(sub, values, diffs))
+                v = _value(sub, values)
+                evaluated = bool(v) if op == "and" else not v
+            else:
+                parts.append("...")
+        return parts
+    else:
+        parts = _paren(spec[1], values, diffs)
+        left = _value(spec[1], values)
+        evaluated = True
+        for op, sub, link in spec[2]:
+            parts.append(op)
+            if evaluated:
+                parts.extend(_paren(sub, values, diffs))
+                right = _value(sub, values)
+                evaluated = bool(values[link])
+                if op == "==" and not evaluated:
+                    diffs.append((left, right))
+                left = right
+            else:
+                parts.append("...")
+        return parts
+
+
+def _value(spec, values):
+    """
+        Return the value of a sub-expression that was evaluated.
+    """
+    if spec[0] == "leaf":
+        return values[spec[1]]
+    elif spec[0] == "not":
+        return not _value(spec[1], values)
+    elif spec[0] == "bool":
+        for sub in spec[2]:
+            v = _value(sub, values)
+            if (spec[1] == "and") != bool(v):
+                return v
+        return v
+    else:
+        for op, sub, link in spec[2]:
+            if not values[link]:
+                break
+        return values[link]
+
+
+def _fail(spec, *msg):
+    """
+        Called by rewritten assertions on failure. Returns an AssertionError
+        carrying the captured operand values.
+    """
+    e = AssertionError(*msg)
+    e._pryDiffs = []
+    try:
+        values = sys._getframe(1).f_locals
+        e._pryCaptured = _render(spec, values, e._pryDiffs)
+    except Exception:
+        e._pryCaptured = None
+    return e
+
+
+class AssertionImporter(object):
+    """
+        A PEP 302 importer that loads registered test modules with their
+        assertions rewritten.
+    """
+    def __init__(self):
+        self.modules = {}
+
+    def register(self, name, path):
+        """
+            Rewrite the top-level module name, found at path, when it is next
+            imported or reloaded.
+        """
+        self.modules[name] = path
+        if self not in sys.meta_path:
+            sys.meta_path.insert(0, self)
+
+    def find_module(self, name, path=None):
+        if path is None and name in self.modules:
+            return self
+        return None
+
+    def load_module(self, name):
+        path = self.modules[name]
+        code = rewrite(open(path, "rU").read(), path)
+        m = sys.modules.get(name)
+        new = m is None
+        if new:
+            m = imp.new_module(name)
+            sys.modules[name] = m
+        m.__file__ = path
+        m.__loader__ = self
+        try:
+            exec code in m.__dict__
+        except:
+            if new:
+                del sys.modules[name]
+            raise
+        return m
+
+
+importer = AssertionImporter()
@@ -1,7 +1,8 @@
 
 import sys, time, traceback, os, fnmatch, config, cProfile, pstats, cStringIO
-import linecache, shutil, tempfile
-import _tinytree, explain, coverage, utils
+import linecache, shutil, tempfile, json, threading
+from xml.sax import saxutils
+import _tinytree, explain, coverage, covdata, utils, rewrite
 
 _TestGlob = "test_*.py"
 
@@ -46,6 +47,8 @@ def raises(exc, obj, *args, **kwargs):
 
 
 class _Error:
+    # Seconds the failing callable ran for, if known.
+    time = None
     def __init__(self, node, msg):
         self.node, self.msg = node, msg
         self.exctype, self.excvalue, self.tb = sys.exc_info()
@@ -53,7 +56,14 @@ class _Error:
         self.explanation = None 
         if self.exctype == AssertionError:
             r = self.extractLine(self.tb)
-            if r[0]:
+            # Assertions in rewritten modules carry the values they tested.
+            # Anything else has to be re-evaluated.
+            captured = getattr(self.excvalue, "_pryCaptured", None)
+            if captured:
+                self.explanation = str(
+                    explain.Captured(r[0], captured, self.excvalue._pryDiffs)
+                )
+            elif r[0]:
                 self.explanation = str(explain.Explain(*r))
         while "libpry" in self.tb.tb_frame.f_code.co_filename:
             next = self.tb.tb_next
@@ -109,10 +119,19 @@ class _OK:
 
 
 class _OutputZero:
+    # Events that cause output to be flushed immediately
+    _urgent = set([
+        "nodeError", "setUpError", "tearDownError", "setUpAllError",
+        "tearDownAllError", "final"
+    ])
+    # If set, _Output calls tick() every tickInterval seconds from a thread.
+    tickInterval = None
     def __init__(self, root):
         self.root = root
         self.maxname = self.root._maxPathLen()
 
+    def tick(self): pass
+
     def nodePre(self, node): pass
     def nodePost(self, node): pass
     def nodeError(self, node): pass
@@ -179,11 +198,26 @@ class _OutputOne(_OutputZero):
             )
 
         if root.cover:
+            # Directories sharing a Coverage object are reported once, under
+            # the first of them.
+            seen = set()
             for i in root.preOrder():
-                if hasattr(i, "coverage") and i.coverage:
+                if hasattr(i, "coverage") and i.coverage and\
+                    id(i.coverage) not in seen:
+                    seen.add(id(i.coverage))
                     lst.append("\n")
                     lst.append("> %s\n"%i.dirPath)
-                    lst.append(i.coverage.coverageReport())
+                    if i.coverage.functions:
+                        lst.append(i.coverage.functionReport())
+                    elif root.changedLines is None:
+                        lst.append(i.coverage.coverageReport())
+                    else:
+                        lst.append(
+                            i.coverage.diffReport(root.changedLines)
+                        )
+                    if i.coverage.hits:
+                        lst.append("\nHottest lines:\n")
+                        lst.append(i.coverage.heatmapReport())
         
         # Profile printing is a massive kludge, mostly because the pstats
         # module is an awful, awful piece of software, perversely designed to
@@ -263,10 +297,447 @@ class _OutputThree(_OutputTwo):
             return "OK (%.3fs)"%node.callState.time
 
 
+class _OutputProgress(_OutputOne):
+    """
+        A progress bar showing completed and total tests, the current test,
+        elapsed time, and an estimate of the time remaining.
+
+        The estimate is based on the durations of tests in previous runs,
+        which are stored in historyFile as the time of a single repetition.
+        Tests that will not run because a fixture failed are taken out of
+        the estimate when their container finishes. The bar is redrawn at
+        most once every redrawInterval seconds on test events, and is also
+        redrawn every tickInterval seconds by the _Output ticker, so that the
+        elapsed time and the estimate keep moving during a long test.
+    """
+    historyFile = ".prytimes"
+    redrawInterval = 0.1
+    tickInterval = 0.5
+    _urgent = set([
+        "nodePre", "nodePost", "nodeError", "nodePass", "setUpError",
+        "tearDownError", "final", "tearDownAllError", "setUpAllError"
+    ])
+    def __init__(self, root):
+        _OutputOne.__init__(self, root)
+        self.historyPath = os.path.abspath(self.historyFile)
+        self.history = self._load()
+        tests = root.tests()
+        self.total = len(tests)
+        self.done = 0
+        self.current = ""
+        self.start = self.lastDraw = time.time()
+        # The start time and the estimated duration of the running test.
+        self.currentStart, self.currentEstimate = self.start, 0.0
+        self.times = {}
+        # Paths of tests that are finished, or taken out of the estimate.
+        self.accounted = set()
+        # Estimated durations of tests not yet run that have a history
+        self.known = 0.0
+        self.unknown = 0
+        for i in tests:
+            t = self.history.get(i.fullPath())
+            if t is None:
+                self.unknown += 1
+            else:
+                self.known += t
+
+    def _load(self):
+        try:
+            return json.load(open(self.historyPath))
+        except (IOError, ValueError):
+            return {}
+
+    def _save(self):
+        self.history.update(self.times)
+        try:
+            f = open(self.historyPath, "w")
+            json.dump(self.history, f)
+            f.close()
+        except IOError:
+            pass
+
+    def eta(self):
+        """
+            Estimated number of seconds left in the run, or None if there is
+            not enough information yet.
+        """
+        durations = self.times.values() or self.history.values()
+        if self.unknown and not durations:
+            return None
+        mean = 0.0
+        if durations:
+            mean = sum(durations)/len(durations)
+        # Time already spent in the running test counts against its share.
+        current = min(time.time() - self.currentStart, self.currentEstimate)
+        return (self.known + self.unknown*mean)*self.root.repeat - current
+
+    def _account(self, path):
+        """
+            Take a test out of the estimate.
+        """
+        if path in self.accounted:
+            return
+        self.accounted.add(path)
+        t = self.history.get(path)
+        if t is None:
+            self.unknown -= 1
+        else:
+            self.known -= t
+
+    def _finished(self, node):
+        if isinstance(node, Test):
+            self.done += 1
+            p = node.fullPath()
+            self._account(p)
+            self.currentEstimate = 0.0
+            if isinstance(node.callState, _OK):
+                self.times[p] = node.callState.time/self.root.repeat
+
+    def _redraw(self, force=False):
+        now = time.time()
+        if not force and now - self.lastDraw < self.redrawInterval:
+            return None
+        self.lastDraw = now
+        eta = self.eta()
+        status = " %s/%s  %.1fs elapsed, ETA %s  "%(
+            self.done,
+            self.total,
+            now - self.start,
+            "?" if eta is None else "%.1fs"%eta
+        )
+        width = utils.terminalWidth() - 1
+        barlen = 20
+        filled = barlen*self.done/max(self.total, 1)
+        bar = "[%s%s]"%("="*filled, " "*(barlen-filled))
+        line = bar + status + self.current
+        return "\r" + line[:width].ljust(width)
+
+    def nodePre(self, node):
+        if isinstance(node, Test):
+            self.current = node.fullPath()
+            self.currentStart = time.time()
+            self.currentEstimate = self.history.get(self.current, 0.0)*\
+                self.root.repeat
+        return self._redraw()
+
+    def nodePost(self, node):
+        if not isinstance(node, Test):
+            # Tests skipped because of fixture errors will never finish.
+            for i in node.tests():
+                self._account(i.fullPath())
+        return self._redraw()
+
+    def tick(self):
+        return self._redraw(True)
+
+    def nodePass(self, node):
+        self._finished(node)
+        return self._redraw()
+
+    def nodeError(self, node):
+        self._finished(node)
+        return self._redraw(True)
+
+    def setUpError(self, node):
+        return self._redraw(True)
+
+    def tearDownError(self, node):
+        return self._redraw(True)
+
+    def setUpAllError(self, node):
+        return self._redraw(True)
+
+    def tearDownAllError(self, node):
+        return self._redraw(True)
+
+    def final(self, root):
+        self._save()
+        self.current = ""
+        return self._redraw(True) + _OutputOne.final(self, root)
+
+
+def _errorInfo(err):
+    """
+        Returns a dictionary describing an _Error object.
+    """
+    return dict(
+        type = err.exctype.__name__,
+        message = str(err.excvalue),
+        traceback = "".join(err.s),
+        explanation = err.explanation,
+    )
+
+
+def _profileInfo(node):
+    """
+        Returns a dictionary summarising the profile statistics of a node, or
+        None if there are none.
+    """
+    s = getattr(node, "profStats", None)
+    if s:
+        return dict(
+            calls = s.total_calls,
+            primitive = s.prim_calls,
+            time = s.total_tt,
+        )
+
+
+class _OutputJUnit(_OutputZero):
+    """
+        Writes JUnit XML. Each test case is written as soon as it finishes,
+        inside a testsuite element for its container. Since cases are not
+        held back, testsuite elements carry no counts - consumers count the
+        cases themselves - and a container whose cases are interrupted by
+        those of a child container gets a second testsuite element. Skipped
+        tests are written by final().
+    """
+    _urgent = set(["final"])
+    started = False
+    def __init__(self, root):
+        _OutputZero.__init__(self, root)
+        # The container whose testsuite element is open, if any.
+        self.suite, self.open = None, False
+
+    def _start(self):
+        if self.started:
+            return ""
+        self.started = True
+        return "".join([
+            '<?xml version="1.0" encoding="utf-8"?>\n',
+            '<testsuites name="pry" tests="%s">\n'%len(self.root.tests()),
+        ])
+
+    def _close(self):
+        if not self.open:
+            return ""
+        self.open = False
+        return "</testsuite>\n"
+
+    def _suite(self, container):
+        """
+            Returns the output needed before a case recorded under container.
+        """
+        if self.open and self.suite is container:
+            return ""
+        lst = [self._start(), self._close()]
+        self.suite, self.open = container, True
+        lst.append(
+            "<testsuite name=%s>\n"%saxutils.quoteattr(
+                (container and container.fullPath()) or "pry"
+            )
+        )
+        return "".join(lst)
+
+    def _case(self, node, name, time=None, err=None, body=""):
+        """
+            Returns a test case, in the suite of node's parent.
+        """
+        attrs = [
+            "classname=%s"%saxutils.quoteattr(
+                node.parent.fullPath() if node.parent else ""
+            ),
+            "name=%s"%saxutils.quoteattr(name)
+        ]
+        if time is not None:
+            attrs.append('time="%.6f"'%time)
+        lst = [self._suite(node.parent), "<testcase %s>"%" ".join(attrs)]
+        if err:
+            info = _errorInfo(err)
+            if err.exctype is AssertionError:
+                tag = "failure"
+            else:
+                tag = "error"
+            text = info["traceback"]
+            if info["explanation"]:
+                text += "\n" + info["explanation"]
+            lst.append(
+                "<%s type=%s message=%s>%s</%s>"%(
+                    tag,
+                    saxutils.quoteattr(info["type"]),
+                    saxutils.quoteattr(info["message"]),
+                    saxutils.escape(text),
+                    tag
+                )
+            )
+        lst.append(body)
+        prof = _profileInfo(node)
+        if prof:
+            lst.append(
+                "<system-out>%(calls)s function calls (%(primitive)s "
+                "primitive calls) in %(time).3f CPU seconds</system-out>"%prof
+            )
+        lst.append("</testcase>\n")
+        return "".join(lst)
+
+    def nodePost(self, node):
+        if self.open and self.suite is node:
+            return self._close()
+
+    def nodePass(self, node):
+        if isinstance(node, Test):
+            return self._case(node, node.name, node.callState.time)
+
+    def nodeError(self, node):
+        return self._case(
+            node, node.name, node.callState.time, err=node.callState
+        )
+
+    def setUpError(self, node):
+        return self._case(node, node.name, err=node.setUpState)
+
+    def tearDownError(self, node):
+        return self._case(
+            node, "%s.tearDown"%node.name, err=node.tearDownState
+        )
+
+    def setUpAllError(self, node):
+        return self._case(
+            node, "%s.setUpAll"%node.name, err=node.setUpAllState
+        )
+
+    def tearDownAllError(self, node):
+        return self._case(
+            node, "%s.tearDownAll"%node.name, err=node.tearDownAllState
+        )
+
+    def final(self, root):
+        lst = [self._start(), self._close()]
+        if isinstance(root.goState, _Error):
+            lst.append(
+                "<testsuite name=\"pry\">"
+                "<testcase classname=\"\" name=\"pry\">"
+                "<error type=\"internal\">%s</error></testcase>"
+                "</testsuite>\n"%(
+                    saxutils.escape("".join(root.goState.s))
+                )
+            )
+        for i in root.allNotRun():
+            lst.append(self._case(i, i.name, body="<skipped/>"))
+        lst.append(self._close())
+        lst.append("</testsuites>\n")
+        return "".join(lst)
+
+
+class _OutputJSON(_OutputZero):
+    """
+        Writes a stream of JSON objects, one per line, as events occur.
+    """
+    _urgent = set(["final"])
+    started = False
+    def _event(self, event, **kwargs):
+        kwargs["event"] = event
+        lst = []
+        if not self.started:
+            self.started = True
+            lst.append(self._event("start", tests=len(self.root.tests())))
+        lst.append(json.dumps(kwargs, sort_keys=True))
+        lst.append("\n")
+        return "".join(lst)
+
+    def nodePass(self, node):
+        if isinstance(node, Test):
+            return self._event(
+                "pass",
+                test = node.fullPath(),
+                time = node.callState.time,
+                profile = _profileInfo(node)
+            )
+
+    def nodeError(self, node):
+        return self._event(
+            "fail",
+            test = node.fullPath(),
+            time = node.callState.time,
+            error = _errorInfo(node.callState)
+        )
+
+    def _fixture(self, node, fixture):
+        state = getattr(node, fixture + "State")
+        return self._event(
+            "fixture-error",
+            node = node.fullPath(),
+            fixture = fixture,
+            time = state.time,
+            error = _errorInfo(state)
+        )
+
+    def setUpError(self, node):
+        return self._fixture(node, "setUp")
+
+    def tearDownError(self, node):
+        return self._fixture(node, "tearDown")
+
+    def setUpAllError(self, node):
+        return self._fixture(node, "setUpAll")
+
+    def tearDownAllError(self, node):
+        return self._fixture(node, "tearDownAll")
+
+    def final(self, root):
+        if isinstance(root.goState, _Error):
+            return self._event("internal-error", error=_errorInfo(root.goState))
+        lst = []
+        notrun = root.allNotRun()
+        for i in notrun:
+            lst.append(self._event("skip", test=i.fullPath()))
+        lst.append(
+            self._event(
+                "final",
+                passed = len(root.allPassed()),
+                failed = len(root.allErrors()),
+                skipped = len(notrun),
+                time = root.goState.time if root.goState else None
+            )
+        )
+        return "".join(lst)
+
+
+class _Tee:
+    """
+        Passes each output event on to a number of _Output objects.
+    """
+    def __init__(self, *outputs):
+        for i in _Output._hooks:
+            setattr(self, i, self._fan([getattr(o, i) for o in outputs]))
+
+    def _fan(self, meths):
+        def fan(*args, **kwargs):
+            for m in meths:
+                m(*args, **kwargs)
+        return fan
+
+
 class _Output:
-    def __init__(self, root, verbosity, fp=sys.stdout):
+    """
+        Writes the strings returned by an output object to a file.
+
+        Output is buffered, and flushed when more than flushSize bytes are
+        waiting, when flushInterval seconds have passed since the last flush,
+        or straight away for the events listed in the output object's _urgent
+        attribute. When a test starts, output that has been waiting for longer
+        than flushInterval is flushed too, even if nothing new is written.
+
+        If the output object has a tickInterval, a daemon thread calls its
+        tick method at that interval until final, and writes the result.
+        Writes are then serialised with a lock.
+    """
+    _hooks = [
+        "nodePre", "nodePost", "nodeError", "nodePass", "setUpError",
+        "tearDownError", "final", "tearDownAllError", "setUpAllError"
+    ]
+    flushSize = 4096
+    flushInterval = 0.2
+    def __init__(self, root, verbosity, fp=sys.stdout, klass=None):
+        """
+            :root The root node of the test tree.
+            :verbosity The verbosity level, used to pick an output class.
+            :fp The file object output is written to.
+            :klass An output class to use regardless of verbosity.
+        """
         self.fp = fp
-        if verbosity == 0:
+        if klass:
+            self.o = klass(root)
+        elif verbosity == 0:
             self.o = _OutputZero(root)
         elif verbosity == 1:
             self.o = _OutputOne(root)
@@ -276,17 +747,83 @@ class _Output:
             self.o = _OutputThree(root)
         else:
             self.o = _OutputThree(root)
-
-    def __getattr__(self, attr):
-        meth = getattr(self.o, attr)
-        def printClosure(*args, **kwargs):
+        self.buf, self.size, self.last = [], 0, time.time()
+        # The time the oldest output in buf was written.
+        self.oldest = None
+        self.lock = None
+        # Bind a writer for each hook once, rather than on every call.
+        for i in self._hooks:
+            setattr(
+                self, i,
+                self._writer(
+                    getattr(self.o, i), i in self.o._urgent, i == "nodePre"
+                )
+            )
+        if self.fp and self.o.tickInterval:
+            self.lock = threading.Lock()
+            self._ticking = threading.Event()
+            t = threading.Thread(target=self._tickLoop, args=(self._ticking,))
+            t.setDaemon(True)
+            t.start()
+            final = self.final
+            def stop(*args, **kwargs):
+                self._ticking.set()
+                final(*args, **kwargs)
+            self.final = stop
+
+    def _writer(self, meth, urgent, pre=False):
+        def write(*args, **kwargs):
             if self.fp:
-                s = meth(*args, **kwargs)
-                if s:
-                    self.fp.write(s)
-                    # Defeat buffering
-                    self.fp.flush()
-        return printClosure
+                if self.lock:
+                    self.lock.acquire()
+                try:
+                    s = meth(*args, **kwargs)
+                    if s:
+                        if not self.buf:
+                            self.oldest = time.time()
+                        self.buf.append(s)
+                        self.size += len(s)
+                        if urgent or self.size >= self.flushSize or\
+                            time.time() - self.last >= self.flushInterval:
+                            self.flush()
+                    elif urgent:
+                        self.flush()
+                    if pre and self.buf and isinstance(args[0], Test) and\
+                        time.time() - self.oldest >= self.flushInterval:
+                        self.flush()
+                finally:
+                    if self.lock:
+                        self.lock.release()
+        return write
+
+    # begin nocover
+    def _tickLoop(self, stopped):
+        while True:
+            stopped.wait(self.o.tickInterval)
+            if stopped.isSet():
+                break
+            self._tick()
+    # end nocover
+
+    def _tick(self):
+        self.lock.acquire()
+        try:
+            # final may have run while we waited for the lock.
+            if self._ticking.isSet():
+                return
+            s = self.o.tick()
+            if s:
+                self.buf.append(s)
+                self.flush()
+        finally:
+            self.lock.release()
+
+    def flush(self):
+        if self.buf:
+            self.fp.write("".join(self.buf))
+            self.fp.flush()
+            self.buf, self.size = [], 0
+        self.last = time.time()
 
 
 class _TestBase(_tinytree.Tree):
@@ -342,13 +879,11 @@ class _TestBase(_tinytree.Tree):
                     r = meth(*args, **kwargs)
             stop = time.time()
         except Exception, e:
-            setattr(
-                dstObj, name + "State",
-                _Error(
-                    dstObj,
-                    "" if name == "call" else name
-                )
-            )
+            # Stop the clock before _Error, which may re-evaluate assertions.
+            stop = time.time()
+            err = _Error(dstObj, "" if name == "call" else name)
+            err.time = stop - start
+            setattr(dstObj, name + "State", err)
             return True
         if r is not _NOTRUN:
             if profile:
@@ -622,6 +1157,15 @@ class TestContainer(_TestBase):
                 shutil.rmtree(i)
         l[:] = []
 
+    def _coverage(self):
+        """
+            The Coverage object of the directory this node is in, if any.
+        """
+        for i in self.pathToRoot():
+            if isinstance(i, _DirNode):
+                return i.coverage
+        return None
+
     def _run(self, output, repeat, profile):
         """
             Run the tests contained in this suite.
@@ -633,7 +1177,13 @@ class TestContainer(_TestBase):
             output.setUpAllError(self)
             return
         self._tmpDirs = oneTmpDirs
+        cov = self._coverage()
         for i in self.children:
+            if cov:
+                # Each test's setUp and tearDown are part of its context.
+                cov.switchContext(
+                    i.fullPath() if isinstance(i, Test) else None
+                )
             output.nodePre(i)
 
             if self._runCallable(self.setUp, i, "setUp", 1, None):
@@ -654,6 +1204,8 @@ class TestContainer(_TestBase):
 
             output.nodePost(i)
 
+        if cov:
+            cov.switchContext(None)
         if self._runCallable(self.tearDownAll, self, "tearDownAll", 1, None):
             output.tearDownAllError(self)
             return
@@ -750,6 +1302,7 @@ class _FileNode(TestContainer):
         modname = filename[:-3]
         TestContainer.__init__(self, name=os.path.join(dirname, modname))
         self.dirname, self.filename = dirname, filename
+        rewrite.importer.register(modname, os.path.join(".", filename))
         m = __import__(modname)
         # When pry starts up, it loads the libpry module. In order for the
         # instantiation stuff in libpry to be counted in coverage, we need to
@@ -780,7 +1333,13 @@ class _DirNode(TestContainer):
         A node representing a directory of tests. 
     """
     CONF = ".pry"
-    def __init__(self, path, cover):
+    def __init__(self, path, cover, session=None):
+        """
+            :path A directory or test file.
+            :cover Whether to run coverage analysis.
+            :session The coverage.Session to take part in. If None, a new
+            one is used.
+        """
         TestContainer.__init__(self, name=None)
         if os.path.isdir(path):
             self.dirPath = path
@@ -801,10 +1360,10 @@ class _DirNode(TestContainer):
         self.coverage = False
         self._pre()
         if cover:
-            self.coverage = coverage.Coverage(
-                self.coveragePath,
-                self.excludeList,
-                True if cover is _DUMMY else False
+            if session is None:
+                session = coverage.Session(cover is _DUMMY)
+            self.coverage = session.coverage(
+                self.coveragePath, self.excludeList
             )
             self.coverage.start()
         l = os.listdir(".")
@@ -845,14 +1404,41 @@ _DUMMY = object()
 class _RootNode(TestContainer):
     """
         This node is the parent of all tests.
+
+        When coverage is on, all directories take part in one
+        coverage.Session, and the static analysis of covered files is cached
+        in analysisFile. Set this to None to disable the on-disk cache.
+
+        If changedLines is set to a dictionary mapping paths to LineSets,
+        coverage reports only cover those lines.
     """
     goState = None
-    def __init__(self, cover, profile):
+    # The number of times each test is run.
+    repeat = 1
+    analysisFile = ".pryanalysis"
+    changedLines = None
+    def __init__(self, cover, profile, covOptions=None):
+        """
+            :cover Whether to run coverage analysis.
+            :profile A pstats sort key, or None to disable profiling.
+            :covOptions A dict of extra keyword arguments for Coverage.
+        """
         TestContainer.__init__(self, name=None)
         self.cover = cover
         self.profile = profile
+        self.analysisCache = None
+        self.session = None
+        if cover:
+            if self.analysisFile:
+                self.analysisCache = coverage.AnalysisCache(self.analysisFile)
+            self.session = coverage.Session(
+                cover is _DUMMY,
+                self.analysisCache,
+                **(covOptions or {})
+            )
 
     def _run(self, output, repeat):
+        self.repeat = repeat
         self._runCallable(
             TestContainer._run,
             self,
@@ -865,6 +1451,28 @@ class _RootNode(TestContainer):
             self.profile
         )
 
+    def mergedCoverage(self):
+        """
+            Returns a Coverage object holding the coverage data gathered by
+            all directories, or None if coverage is off.
+        """
+        covs = []
+        for i in self.preOrder():
+            c = getattr(i, "coverage", None)
+            if c and c not in covs:
+                covs.append(c)
+        if covs:
+            return covdata.merge(covs)
+
+    def saveCoverage(self, path):
+        """
+            Write the coverage data gathered by all directories to a data
+            file.
+        """
+        cov = self.mergedCoverage()
+        if cov:
+            covdata.write(path, cov)
+
     def addPath(self, path, recurse):
         if recurse:
             dirset = set()
@@ -874,6 +1482,14 @@ class _RootNode(TestContainer):
             l = list(dirset)
             l.sort()
             for i in l:
-                self.addChild(_DirNode(i, self.cover))
+                self.addChild(_DirNode(i, self.cover, self.session))
         else:
-            self.addChild(_DirNode(path, self.cover))
+            self.addChild(_DirNode(path, self.cover, self.session))
+
+    def saveAnalysis(self):
+        """
+            Save the analysis cache. Call this after the coverage report, so
+            that files analysed for the report are included.
+        """
+        if self.analysisCache:
+            self.analysisCache.save()
@@ -51,6 +51,124 @@ def isPathContainedAny(outerList, inner):
     return False
 
 
+class _TrieNode:
+    def __init__(self):
+        # True if paths ending here, and everything below them, match.
+        self.end = False
+        self.children = {}
+        # A list of (glob, node) tuples for components with wildcards.
+        self.globs = []
+        # The node for a "**" component, if any.
+        self.deep = None
+        # True for the node after a "**", which matches any number of
+        # directories.
+        self.loop = False
+
+
+class PathMatcher:
+    """
+        A set of paths and glob patterns, compiled into a trie of path
+        components, for matching many paths against many exclusions.
+
+        A path matches if it, or a directory containing it, is one of the
+        paths, or matches one of the patterns. Pattern components are matched
+        against single path components with fnmatch, except for "**", which
+        matches any number of directories. Matching costs time proportional
+        to the depth of the path, however many entries there are, and walk()
+        only steps one component down the trie for each directory and file.
+    """
+    def __init__(self, patterns):
+        self.root = _TrieNode()
+        for p in patterns:
+            node = self.root
+            for c in self._split(p):
+                if c == "**":
+                    if not node.deep:
+                        node.deep = _TrieNode()
+                        node.deep.loop = True
+                    node = node.deep
+                elif _isGlob(c):
+                    for g, n in node.globs:
+                        if g == c:
+                            node = n
+                            break
+                    else:
+                        n = _TrieNode()
+                        node.globs.append((c, n))
+                        node = n
+                else:
+                    node = node.children.setdefault(c, _TrieNode())
+            node.end = True
+
+    def _split(self, path):
+        return os.path.abspath(path).split(os.sep)
+
+    def _closure(self, nodes):
+        for n in nodes:
+            if n.deep and n.deep not in nodes:
+                nodes.append(n.deep)
+        return nodes
+
+    def _step(self, nodes, name):
+        """
+            Returns the nodes reached from nodes through the path component
+            name, or None if the path matches.
+        """
+        result = []
+        for n in nodes:
+            if n.loop:
+                result.append(n)
+            c = n.children.get(name)
+            if c:
+                result.append(c)
+            for g, c in n.globs:
+                if fnmatch.fnmatchcase(name, g):
+                    result.append(c)
+        for n in self._closure(result):
+            if n.end:
+                return None
+        return result
+
+    def _start(self, path):
+        nodes = self._closure([self.root])
+        for c in self._split(path):
+            nodes = self._step(nodes, c)
+            if nodes is None:
+                return None
+        return nodes
+
+    def match(self, path):
+        return self._start(path) is None
+
+    def walk(self, path):
+        """
+            Like os.walk, but leaves out matching files, and does not
+            descend into matching directories.
+        """
+        nodes = self._start(path)
+        if nodes is None:
+            return
+        states = {path: nodes}
+        for root, dirs, files in os.walk(path):
+            nodes = states.pop(root)
+            keep = []
+            for d in dirs:
+                n = self._step(nodes, d)
+                if n is not None:
+                    states[os.path.join(root, d)] = n
+                    keep.append(d)
+            dirs[:] = keep
+            files = [f for f in files if self._step(nodes, f) is not None]
+            yield root, dirs, files
+
+
+def _isGlob(s):
+    for c in "*?[":
+        if c in s:
+            return True
+    return False
+
+
 def isStringLike(anobj):
     try:
         # Avoid succeeding expensively if anobj is large.
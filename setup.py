@@ -12,7 +12,7 @@ Features
     * No implicit instantiation of test suits
     * Powerful command-line interface
 
-Pry requires Python 2.5.2 or newer.
+Pry requires Python 2.6 or newer.
 """
 
 version = "0.2.1"
@@ -0,0 +1,19 @@
+def f():
+    def inner():
+        pass
+    return lambda: inner()
+
+
+class A:
+    def method(self):
+        return [i for i in (1, 2)]
+
+    class B:
+        def method(self):
+            pass
+
+
+# begin nocover
+def excluded():
+    pass
+# end nocover
@@ -0,0 +1,7 @@
+def f(x):
+    if x:
+        return 1
+    #begin nocover
+    else:
+        return 2
+    #end nocover
@@ -0,0 +1,11 @@
+def loop(n):
+    x = 0
+    for i in range(n):
+        x += i
+    return x
+
+
+def branch(x):
+    if x:
+        return 1
+    return 2
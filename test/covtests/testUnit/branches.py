@@ -0,0 +1,20 @@
+def f(x, y):
+    if x and y:
+        a = 1
+    else:
+        a = 2
+    for i in range(x):
+        if i:
+            continue
+        a += i
+    while a > 10:
+        a -= 1
+    return a if y else -a
+
+def g(x):
+    if x:
+        return 1
+
+def h(items):
+    for i in items:
+        pass
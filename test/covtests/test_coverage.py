@@ -151,6 +151,173 @@ class uCoverage(libpry.AutoTree):
         self.cov.stop()
         self.cov.coverageReport()
 
+    def test_adaptive(self):
+        import testUnit.adaptive
+        self.cov.start()
+        reload(testUnit.adaptive)
+        testUnit.adaptive.loop(10)
+        testUnit.adaptive.branch(1)
+        self.cov.stop()
+        f = self.cov.fileDict[os.path.abspath("testUnit/adaptive.py")]
+        assert f.executed == set([1, 2, 3, 4, 5, 8, 9, 10])
+        assert self.done(testUnit.adaptive.loop)
+        assert not self.done(testUnit.adaptive.branch)
+
+        self.cov.start()
+        testUnit.adaptive.branch(0)
+        self.cov.stop()
+        assert not f.notExecuted
+        assert self.done(testUnit.adaptive.branch)
+
+    def test_contexts(self):
+        import testUnit.adaptive
+        cov = libpry.coverage.Coverage("./testUnit", contexts=True)
+        cov.start()
+        cov.switchContext("loop")
+        testUnit.adaptive.loop(2)
+        cov.switchContext("both")
+        testUnit.adaptive.loop(2)
+        testUnit.adaptive.branch(0)
+        cov.stop()
+        p = os.path.abspath("testUnit/adaptive.py")
+        assert cov.whoCovers(p, 4) == ["both", "loop"]
+        assert cov.whoCovers(p, 11) == ["both"]
+        assert cov.fileDict[p].executed == set([2, 3, 4, 5, 9, 11])
+
+    def test_branches(self):
+        import testUnit.branches
+        cov = libpry.coverage.Coverage("./testUnit", branches=True)
+        cov.start()
+        testUnit.branches.f(3, 0)
+        testUnit.branches.g(0)
+        testUnit.branches.h([])
+        cov.stop()
+        f = cov.fileDict[os.path.abspath("testUnit/branches.py")]
+        assert f.arcs == set([
+            (2, 5), (6, 7), (6, 10), (7, 8), (7, 9), (10, 12), (15, -14),
+            (19, -18),
+        ])
+        assert f.missingArcs == set([(2, 3), (10, 11), (15, 16), (19, 20)])
+
+        cov.start()
+        testUnit.branches.g(1)
+        testUnit.branches.g(1)
+        cov.stop()
+        entry = cov._codeCache[id(testUnit.branches.g.func_code)]
+        assert not entry[2] and not entry[3]
+
+    def test_threads(self):
+        import threading, testUnit.adaptive
+        self.cov.start()
+        t = threading.Thread(target=testUnit.adaptive.branch, args=(0,))
+        t.start()
+        t.join()
+        ready, go = threading.Event(), threading.Event()
+        def late():
+            ready.set()
+            go.wait()
+            testUnit.adaptive.branch(1)
+        t = threading.Thread(target=late)
+        t.start()
+        ready.wait()
+        self.cov.stop()
+        go.set()
+        t.join()
+        self.cov.stop()
+        f = self.cov.fileDict[os.path.abspath("testUnit/adaptive.py")]
+        assert f.executed == set([9, 11])
+        assert len(self.cov._recorders) == 2
+
+    def test_functions(self):
+        import threading, testUnit.adaptive
+        cov = libpry.coverage.Coverage("./testUnit", functions=True)
+        cov.start()
+        testUnit.adaptive.loop(5)
+        t = threading.Thread(target=testUnit.adaptive.branch, args=(0,))
+        t.start()
+        t.join()
+        cov.stop()
+        f = cov.fileDict[os.path.abspath("testUnit/adaptive.py")]
+        assert f.called == set([1, 8])
+        assert not f.executed
+        assert not f.notCalled
+
+    def test_sample(self):
+        import threading, testUnit.adaptive
+        cov = libpry.coverage.Coverage("./testUnit", sample=0.001)
+        cov.start()
+        t = threading.Thread(target=testUnit.adaptive.loop, args=(1000000,))
+        t.start()
+        t.join()
+        cov.stop()
+        assert not cov._sampler
+        f = cov.fileDict[os.path.abspath("testUnit/adaptive.py")]
+        assert f.executed & set([3, 4])
+        assert f.executed <= set([2, 3, 4, 5])
+
+    def test_hits(self):
+        import threading, testUnit.adaptive
+        cov = libpry.coverage.Coverage("./testUnit", hits=True)
+        cov.start()
+        testUnit.adaptive.loop(5)
+        testUnit.adaptive.loop(5)
+        t = threading.Thread(target=testUnit.adaptive.branch, args=(0,))
+        t.start()
+        t.join()
+        cov.stop()
+        cov._mergeThreads()
+        f = cov.fileDict[os.path.abspath("testUnit/adaptive.py")]
+        assert f.hits == {2: 2, 3: 12, 4: 10, 5: 2, 9: 1, 11: 1}
+        assert set(f.times) == set(f.hits)
+        assert f.executed == set([2, 3, 4, 5, 9, 11])
+        assert "adaptive.py" in cov.heatmapReport()
+
+    def test_subprocesses(self):
+        import subprocess, multiprocessing, testUnit.adaptive
+        cov = libpry.coverage.Coverage("./testUnit", subprocesses=True)
+        cov.start()
+        subprocess.check_call([
+            sys.executable, "-c",
+            "import testUnit.mymod; testUnit.mymod.run(1, 2)"
+        ])
+        p = multiprocessing.Process(
+            target=testUnit.adaptive.branch, args=(1,)
+        )
+        p.start()
+        p.join()
+        cov.stop()
+        assert "PRY_COVERAGE" not in os.environ
+        f = cov.fileDict[os.path.abspath("testUnit/mymod.py")]
+        assert set([3, 4, 5, 8, 12]) <= f.executed
+        f = cov.fileDict[os.path.abspath("testUnit/adaptive.py")]
+        assert 10 in f.executed
+
+    def test_subprocesses_functions(self):
+        import subprocess
+        cov = libpry.coverage.Coverage(
+            "./testUnit", subprocesses=True, functions=True
+        )
+        cov.start()
+        subprocess.check_call([
+            sys.executable, "-c",
+            "import testUnit.mymod; testUnit.mymod.run(1, 2)"
+        ])
+        cov.stop()
+        f = cov.fileDict[os.path.abspath("testUnit/mymod.py")]
+        assert 3 in f.called
+        assert not f.executed
+
+    def done(self, func):
+        entry = self.cov._codeCache[id(func.func_code)]
+        return entry[1] and not entry[2]
+
+    def test_ignored(self):
+        self.cov.start()
+        os.path.isdir("/")
+        self.cov.stop()
+        entry = self.cov._codeCache[id(os.path.isdir.func_code)]
+        assert entry[1] is None
+
 
 tests = [
     uCoverage()
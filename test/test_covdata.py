@@ -0,0 +1,123 @@
+import os.path
+import libpry
+import libpry.coverage
+import libpry.covdata as covdata
+from libpry.lineset import LineSet
+
+
+class uDataFile(libpry.AutoTree):
+    def setUp(self):
+        self.d = self.tmpdir()
+        self.c = libpry.coverage.Coverage("testmodule")
+        self.fname = os.path.abspath("testmodule/test_a.py")
+
+    def _write(self, name, executed, hash=None, contexts={}, arcs=()):
+        f = self.c.fileDict[self.fname]
+        f.executed = LineSet(executed)
+        f.arcs = set(arcs)
+        if hash:
+            f.hash = hash
+        self.c.contextNames = sorted(contexts)
+        f.contexts = {}
+        for i, k in enumerate(self.c.contextNames):
+            for l in contexts[k]:
+                f.contexts.setdefault(l, LineSet()).add(i)
+        path = os.path.join(self.d, name)
+        covdata.write(path, self.c)
+        return path
+
+    def test_roundtrip(self):
+        p = self._write(
+            "a", [1, 2], contexts=dict(x=[1, 2], y=[2]), arcs=[(1, 2), (2, -1)]
+        )
+        c = covdata.read(p)
+        assert c.coveragePath == self.c.coveragePath
+        assert c.contextNames == ["x", "y"]
+        assert len(c.fileDict) == len(self.c.fileDict)
+        for f in c.fileDict.values():
+            orig = self.c.fileDict[f.path]
+            assert f.hash == orig.hash
+            assert f.executable == orig.executable
+            assert f.exclusions == orig.exclusions
+            assert f.executed == orig.executed
+            assert f.contexts == orig.contexts
+            assert f.arcs == orig.arcs
+
+    def test_contexts(self):
+        a = self._write("a", [1, 2], contexts=dict(x=[1, 2]))
+        b = self._write("b", [2, 4], contexts=dict(x=[2], y=[4]))
+        c = covdata.combine([a, b])
+        assert c.contextNames == ["x", "x", "y"]
+        assert c.whoCovers(self.fname, 2) == ["x"]
+        assert c.whoCovers(self.fname, 4) == ["y"]
+        assert c.whoCovers(self.fname, 3) == []
+        assert c.whoCovers("nonexistent", 3) == []
+        assert c.uniqueLines() == [
+            (self.fname, 1, "x"), (self.fname, 2, "x"), (self.fname, 4, "y")
+        ]
+
+    def test_merge(self):
+        self.c.fileDict[self.fname].executed = LineSet([1])
+        other = libpry.coverage.Coverage("testmodule")
+        other.fileDict[self.fname].executed = LineSet([2])
+        self.c.fileDict[self.fname].hits = {1: 2}
+        other.fileDict[self.fname].hits = {1: 3}
+        other.fileDict[self.fname].times = {1: 0.5}
+        c = covdata.merge([self.c, other])
+        assert c.fileDict[self.fname].executed == set([1, 2])
+        assert c.fileDict[self.fname].hits == {1: 5}
+        assert c.fileDict[self.fname].times == {1: 0.5}
+        assert self.c.fileDict[self.fname].executed == set([1])
+
+    def test_combine(self):
+        a = self._write("a", [1, 2])
+        b = self._write("b", [2, 4])
+        c = covdata.combine([a, b])
+        assert c.coveragePath == self.c.coveragePath
+        assert c.fileDict[self.fname].executed == set([1, 2, 4])
+        assert c.coverageReport()
+
+    def test_arcs(self):
+        a = self._write("a", [1], arcs=[(1, 2)])
+        b = self._write("b", [1], arcs=[(1, 3)])
+        c = covdata.combine([a, b])
+        assert c.fileDict[self.fname].arcs == set([(1, 2), (1, 3)])
+
+    def test_combine_changed(self):
+        a = self._write("a", [1])
+        b = self._write("b", [2], hash="stale")
+        c = covdata.combine([b, a])
+        assert c.fileDict[self.fname].executed == set([1])
+        c = covdata.combine([a, b])
+        assert c.fileDict[self.fname].executed == set([1])
+
+    def test_combine_missing(self):
+        f = self.c.fileDict[self.fname]
+        f.analyse()
+        f.path = "nonexistent"
+        a = self._write("a", [1], hash="one")
+        b = self._write("b", [2], hash="two")
+        c = covdata.combine([a, b])
+        assert c.fileDict["nonexistent"].hash == "one"
+        assert c.fileDict["nonexistent"].executed == set([1])
+
+    def test_bad(self):
+        p = os.path.join(self.d, "bad")
+        open(p, "wb").write("foo")
+        libpry.raises("not a coverage data file", covdata.read, p)
+        open(p, "wb").write(covdata.MAGIC + chr(99))
+        libpry.raises("unsupported", covdata.read, p)
+
+
+class u_commonRoot(libpry.AutoTree):
+    def test_commonRoot(self):
+        assert covdata.commonRoot(["/a/b"]) == "/a/b"
+        assert covdata.commonRoot(["/a/b", "/a/b"]) == "/a/b"
+        assert covdata.commonRoot(["/a/bc", "/a/bd"]) == "/a"
+        assert covdata.commonRoot(["/a/b", "/a/b/c"]) == "/a/b"
+
+
+tests = [
+    uDataFile(),
+    u_commonRoot(),
+]
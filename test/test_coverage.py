@@ -1,7 +1,8 @@
-import dis
-import os.path
+import dis, marshal
+import os.path, sys, subprocess
 import libpry
 import libpry.coverage
+from libpry.lineset import LineSet
 
 
 class uFile(libpry.AutoTree):
@@ -38,6 +39,20 @@ class uFile(libpry.AutoTree):
         expected = [1, 255]
         assert f._extractLineOffsets(offsets) == expected
 
+        offsets = [
+            #byte    line
+            chr(19), chr(255),
+            chr(9), chr(15),
+        ]
+        expected = [255, 15]
+        assert f._extractLineOffsets(offsets) == expected
+
+    def test_getLines_jump255(self):
+        f = libpry.coverage.File(None)
+        src = "a = 1\n" + "\n"*254 + "b = 2\nc = 3\n"
+        code = compile(src, "<test>", "exec")
+        assert f.getLines(code) == set([1, 256, 257])
+
     def test_getLines(self):
         f = libpry.coverage.File(None)
         fname = "covfiles/linenos.py"
@@ -71,6 +86,16 @@ class uFile(libpry.AutoTree):
         f = libpry.coverage.File("covfiles/combo.py")
         assert f.executable == set([3, 4, 11])
 
+    def test_lazy(self):
+        f = libpry.coverage.File("nonexistent")
+        assert f.executed == set()
+        libpry.raises(IOError, getattr, f, "executable")
+        libpry.raises(AttributeError, getattr, f, "foo")
+        f = libpry.coverage.File("covfiles/exclusions_err.py")
+        libpry.raises("unbalanced", getattr, f, "hash")
+        libpry.raises(AttributeError, getattr, libpry.coverage.File(None),
+                      "executable")
+
     def test_nicePath(self):
         f = libpry.coverage.File(None)
         f.path = os.path.sep[0] + os.path.join("foo", "bar.py")
@@ -82,6 +107,8 @@ class uFile(libpry.AutoTree):
         f2 = libpry.coverage.File(os.path.join("testmodule", "test_a.py"))
         f1.executed.add(f1.executable.pop())
         assert cmp(f1, f2)
+        f3 = libpry.coverage.File(os.path.join("testmodule", "test_a.py"))
+        assert not cmp(f2, f3)
 
     def test_annotated(self):
         f = libpry.coverage.File(os.path.join("testmodule", "test_a.py"))
@@ -112,6 +139,124 @@ class uFile(libpry.AutoTree):
         assert out == ' 11111\n 22222\n 33333'
 
 
+class uAnalysisCache(libpry.AutoTree):
+    def setUp(self):
+        self.d = self.tmpdir()
+        self.src = os.path.join(self.d, "src.py")
+        open(self.src, "w").write("a = 1\nb = 2\n")
+        self.path = os.path.join(self.d, "cache")
+        self.cache = libpry.coverage.AnalysisCache(self.path)
+
+    def test_hit(self):
+        f = libpry.coverage.File(self.src, self.cache)
+        assert not self.cache.dirty
+        f.analyse()
+        assert self.cache.dirty
+        self.cache.save()
+        assert not self.cache.dirty
+        c = libpry.coverage.AnalysisCache(self.path)
+        assert c.get(os.path.abspath(self.src))
+        g = libpry.coverage.File(self.src, c)
+        assert g.hash == f.hash
+        assert not c.dirty
+        assert g.executable == f.executable == set([1, 2])
+        assert g.exclusions == f.exclusions
+        assert g.functions == f.functions == {}
+        c.save()
+
+    def test_stale(self):
+        libpry.coverage.File(self.src, self.cache).analyse()
+        open(self.src, "a").write("c = 3\n")
+        assert self.cache.get(os.path.abspath(self.src)) is None
+        f = libpry.coverage.File(self.src, self.cache)
+        assert f.executable == set([1, 2, 3])
+
+    def test_bad(self):
+        open(self.path, "wb").write("foo")
+        assert libpry.coverage.AnalysisCache(self.path).entries == {}
+        marshal.dump(("1.0", {"foo": None}), open(self.path, "wb"))
+        assert libpry.coverage.AnalysisCache(self.path).entries == {}
+
+    def test_save_error(self):
+        c = libpry.coverage.AnalysisCache(os.path.join(self.d, "a", "b"))
+        libpry.coverage.File(self.src, c).analyse()
+        c.save()
+        assert not c.dirty
+
+    def test_memory(self):
+        c = libpry.coverage.AnalysisCache(None)
+        libpry.coverage.File(self.src, c).analyse()
+        c.save()
+        assert c.dirty
+        assert c.get(os.path.abspath(self.src))
+
+
+class u_codeBranches(libpry.AutoTree):
+    def test_getBranches(self):
+        fname = "covfiles/branches.py"
+        code = compile(open(fname).read(), fname, "exec")
+        b = libpry.coverage.File(None).getBranches(code)
+        assert b == {
+            2: set([3, 5]),
+            6: set([7, 10]),
+            7: set([8, 9]),
+            10: set([11, 12]),
+            15: set([16, -14]),
+            19: set([20, -18]),
+            23: set([23, 24]),
+            27: set([27, -22]),
+        }
+        assert not libpry.coverage._codeBranches(code)
+
+    def test_extended(self):
+        src = "if x:\n" + "    y = 1\n"*20000 + "z = 1\n"
+        code = compile(src, "<test>", "exec")
+        b = libpry.coverage._codeBranches(code)
+        assert b == {1: set([2, 20002])}
+
+    def test_file(self):
+        f = libpry.coverage.File("covfiles/branches.py")
+        assert len(f.branches) == 8
+        f.executed = LineSet([2, 3, 15])
+        f.arcs = set([(2, 3)])
+        assert f.missingArcs == set([(15, 16), (15, -14), (2, 5)])
+        libpry.raises(AttributeError, getattr, libpry.coverage.File(None),
+                      "branches")
+
+    def test_file_nocover(self):
+        f = libpry.coverage.File("covfiles/nocoverbranch.py")
+        assert f.branches[2] == set([3, 6])
+        assert f.possibleArcs == set([(2, 3)])
+        c = libpry.coverage.Coverage("covfiles", branches=True)
+        code = compile(open(f.path).read(), f.path, "exec")
+        assert c._classify(code.co_consts[0])[3] == set([(2, 3)])
+
+
+class u_codeFunctions(libpry.AutoTree):
+    def test_codeFunctions(self):
+        fname = "covfiles/functions.py"
+        code = compile(open(fname).read(), fname, "exec")
+        assert libpry.coverage._codeFunctions(code) == {
+            1: "f", 2: "f.inner", 8: "A.method", 12: "A.B.method",
+            17: "excluded"
+        }
+
+    def test_file(self):
+        f = libpry.coverage.File("covfiles/functions.py")
+        assert 17 not in f.functions
+        f.called.update([2, 8, 100])
+        assert f.notCalled == ["A.B.method", "f"]
+
+
+class u_codeLines(libpry.AutoTree):
+    def test_codeLines(self):
+        fname = "covfiles/linenos.py"
+        code = compile(open(fname).read(), fname, "exec")
+        lines = libpry.coverage._codeLines(code)
+        assert lines
+        assert lines <= libpry.coverage.File(fname).executable
+
+
 class uCoverage(libpry.AutoTree):
     def setUp(self):
         self.c = libpry.coverage.Coverage("testmodule")
@@ -124,6 +269,312 @@ class uCoverage(libpry.AutoTree):
     def test_coverageReport(self):
         assert self.c.coverageReport()
 
+    def test_classify(self):
+        f = self.c.fileDict[os.path.abspath("testmodule/test_a.py")]
+        code = compile(open(f.path).read(), f.path, "exec")
+        entry = self.c._classify(code)
+        assert entry[0] is code
+        assert entry[1] is f.executed
+        assert entry[2] == f.executable & libpry.coverage._codeLines(code)
+        assert self.c._classify(compile("1", "foo", "exec"))[2] is None
+
+        code = compile("1", "covfiles/exclusions_err.py", "exec")
+        f = libpry.coverage.File(code.co_filename)
+        self.c.fileDict[f.path] = f
+        assert self.c._classify(code)[2] == set()
+        libpry.raises("unbalanced", self.c.coverageReport)
+
+        self.c.maxCodeCache = 2
+        self.c._classify(code)
+        assert len(self.c._codeCache) == 1
+
+    def test_analyse(self):
+        f = libpry.coverage.File(os.path.abspath("covfiles/combo.py"))
+        assert not f.analysed
+        h, executable, exclusions, functions = libpry.coverage._analyse(
+            f.path
+        )
+        assert f.executable == executable
+        assert f.exclusions == exclusions
+        assert f.hash == h
+        assert f.functions == functions
+        assert f.analysed
+
+    def test_classify_branches(self):
+        c = libpry.coverage.Coverage("covfiles", branches=True)
+        f = c.fileDict[os.path.abspath("covfiles/branches.py")]
+        code = compile(open(f.path).read(), f.path, "exec")
+        func = code.co_consts[0]
+        entry = c._classify(func)
+        assert entry[3] == set([
+            (2, 3), (2, 5), (6, 7), (6, 10), (7, 8), (7, 9), (10, 11), (10, 12)
+        ])
+        assert entry[4] is f.arcs
+        f.arcs.add((2, 3))
+        c._codeCache.clear()
+        assert (2, 3) not in c._classify(func)[3]
+        assert c._classify(compile("1", "foo", "exec"))[3] == set()
+        code = compile("1", "covfiles/exclusions_err.py", "exec")
+        assert c._classify(code)[3] == set()
+
+    def test_report_branches(self):
+        c = libpry.coverage.Coverage("covfiles/branches.py", branches=True)
+        f = c.fileDict[os.path.abspath("covfiles/branches.py")]
+        f.executed = LineSet([2, 3, 15])
+        f.arcs = set([(2, 3)])
+        s = c.coverageReport()
+        assert "branches: 2->5 15->exit 15->16" in s
+        assert "Branches: 1 of 16 taken" in s
+
+    def test_threads(self):
+        f = self.c.fileDict[os.path.abspath("testmodule/test_a.py")]
+        r = libpry.coverage._ThreadRecorder(self.c)
+        assert r.fileDict is self.c.fileDict
+        r._target(f).add(1)
+        assert not f.executed
+        self.c._recorders.append(r)
+        self.c._mergeThreads()
+        assert f.executed == set([1])
+        code = compile(open(f.path).read(), f.path, "exec")
+        assert r._classify(code)[1] is r.lines[f.path]
+
+    def test_tracer(self):
+        assert self.c._tracer() == self.c._globalTrace
+        c = libpry.coverage.Coverage("testmodule", branches=True)
+        assert c._tracer() == c._branchTrace
+        c.hits = True
+        assert c._tracer() == c._hitTrace
+
+    def test_hits(self):
+        c = libpry.coverage.Coverage("testmodule", dummy=True, hits=True)
+        f = c.fileDict[os.path.abspath("testmodule/test_a.py")]
+        code = compile(open(f.path).read(), f.path, "exec")
+        entry = c._classify(code)
+        assert entry[-2] is f.hits
+        assert entry[-1] is f.times
+        assert c._classify(compile("1", "foo", "exec"))[-2:] == (None, None)
+        f.hits[1], f.times[1] = 2, 0.5
+        r = libpry.coverage._ThreadRecorder(c)
+        assert r.hits
+        hits, times = r._classify(code)[-2:]
+        hits[1], times[1] = 1, 0.25
+        hits[3], times[3] = 1, 1.0
+        c._recorders.append(r)
+        c._mergeThreads()
+        assert f.hits == {1: 3, 3: 1}
+        assert f.times == {1: 0.75, 3: 1.0}
+        assert not hits and not times
+        c._mergeThreads()
+        assert f.hits == {1: 3, 3: 1}
+        assert f.hottest(1) == [(1.0, 1, 3)]
+        assert f.hottest(5) == [(1.0, 1, 3), (0.75, 3, 1)]
+        s = c.heatmapReport()
+        assert s.startswith(" 1.750000s  ")
+        assert "     3:  1.000000s        1 hits\n" in s
+        assert len(c.heatmapReport(1).splitlines()) == 2
+
+    def test_getHeatmap(self):
+        f = libpry.coverage.File("covfiles/branches.py")
+        f.hits, f.times = {2: 5}, {2: 0.125}
+        lines = f.getHeatmap().splitlines()
+        assert lines[0] == " "*19 + "| def f(x, y):"
+        assert lines[1].startswith("       5  0.125000 | ")
+        assert len(lines) == len(open(f.path).readlines())
+
+    def test_functions(self):
+        c = libpry.coverage.Coverage("covfiles", dummy=True, functions=True)
+        # Like the line report, the function report needs every file to be
+        # analysed.
+        libpry.raises("unbalanced", c.functionReport)
+        c = libpry.coverage.Coverage(
+            "covfiles", ["covfiles/exclusions_err.py"], dummy=True,
+            functions=True
+        )
+        assert c._tracer() == c._functionTrace
+        f = c.fileDict[os.path.abspath("covfiles/functions.py")]
+        code = compile(open(f.path).read(), f.path, "exec")
+        c._classifyFunction(code.co_consts[0])
+        c._classifyFunction(compile("1", "foo", "exec"))
+        assert c._calledLines == {f.path: set([1])}
+        assert len(c._called) == 2
+        c.stop()
+        assert f.called == set([1])
+        # Merging again adds nothing new.
+        c.stop()
+        assert f.called == set([1])
+        c.maxCodeCache = 2
+        c._classifyFunction(code)
+        assert c._called.keys() == [id(code)]
+        s = c.functionReport()
+        assert "[4   ] [1   ] [25.0  %]     functions.py" in s
+        assert "A.B.method A.method f.inner" in s
+        c = libpry.coverage.Coverage("nonexistent", functions=True)
+        assert "[0   ] [0   ] [100.0 %]" in c.functionReport()
+
+    def test_sample(self):
+        c = libpry.coverage.Coverage(
+            "test_coverage.py", dummy=True, sample=0.01
+        )
+        frame = sys._getframe()
+        line = frame.f_lineno + 1
+        c._sampleFrames([frame])
+        f = c.fileDict[os.path.abspath("test_coverage.py")]
+        assert f.executed == set([line])
+        c._sampleFrames([frame])
+        assert len(f.executed) == 2
+        assert "Sampled every 10ms" in c.coverageReport()
+        assert "Sampled" not in self.c.coverageReport()
+
+    def test_subprocesses(self):
+        old = os.environ.get("PYTHONPATH")
+        os.environ["PYTHONPATH"] = "foo"
+        try:
+            self._subprocesses()
+        finally:
+            if old is None:
+                del os.environ["PYTHONPATH"]
+            else:
+                os.environ["PYTHONPATH"] = old
+
+    def _subprocesses(self):
+        c = libpry.coverage.Coverage(
+            "testmodule", dummy=True, contexts=True, subprocesses=True
+        )
+        c._afterFork()
+        c._exportEnv()
+        d, environ = c.dataDir, c._environ
+        assert os.environ["PRY_COVERAGE"] == d
+        assert os.environ["PYTHONPATH"].split(os.pathsep)[0] == d
+        assert os.path.isfile(os.path.join(d, "sitecustomize.py"))
+        config = marshal.load(open(os.path.join(d, "config"), "rb"))
+        assert config["coveragePath"] == c.coveragePath
+        assert config["cache"] is None
+        assert not config["hits"]
+        # Pretend to be a child forked during a test.
+        c.tracing = True
+        c.switchContext("test")
+        f = c.fileDict[os.path.abspath("testmodule/test_a.py")]
+        f.executed.add(1)
+        c._target(f).add(4)
+        f.called.add(1)
+        f.hits[1] = 1
+        c._called[1] = None
+        c._calledLines[f.path] = set([1])
+        r = libpry.coverage._ThreadRecorder(c)
+        c._recorders.append(r)
+        r._target(f).add(3)
+        r._hitTarget(f)[0][3] = 1
+        c._afterFork()
+        c._finalizer.cancel()
+        assert c._environ is None
+        assert not f.executed
+        assert not f.called and not c._called
+        assert not c._calledLines[f.path]
+        assert not f.hits and not r.hitData[f.path][0]
+        assert not c._target(f)
+        assert not r.lines[f.path]
+        assert c.contextNames == ["test"]
+        c._target(f).add(2)
+        f.called.add(5)
+        f.hits[2] = 3
+        c._saveSubprocess()
+        assert [i for i in os.listdir(d) if i.endswith(".prycoverage")]
+
+        p = libpry.coverage.Coverage(
+            "testmodule", dummy=True, contexts=True, subprocesses=True
+        )
+        p.dataDir, p._environ = d, environ
+        p.switchContext("parent")
+        p._collectSubprocesses()
+        assert not os.path.exists(d)
+        assert "PRY_COVERAGE" not in os.environ
+        assert os.environ["PYTHONPATH"] == "foo"
+        assert p.fileDict[f.path].executed == set([2])
+        assert p.fileDict[f.path].called == set([5])
+        assert p.fileDict[f.path].hits == {2: 3}
+        assert p.whoCovers(f.path, 2) == ["test"]
+        # Records of files whose source has changed are ignored.
+        p._addData(([], [(f.path, "", 1 << 7, [], {}, {}, {}, 0)]))
+        assert p.fileDict[f.path].executed == set([2])
+
+    def test_siteCustomize(self):
+        d = self.tmpdir()
+        data, other = os.path.join(d, "data"), os.path.join(d, "other")
+        os.makedirs(os.path.join(data, "libpry"))
+        os.mkdir(other)
+        # A libpry that can't be imported must not stop the shadowed
+        # sitecustomize from loading.
+        open(os.path.join(data, "libpry", "__init__.py"), "w").write(
+            "raise ImportError\n"
+        )
+        open(os.path.join(data, "sitecustomize.py"), "w").write(
+            libpry.coverage._siteCustomize%dict(libdir=d, dir=data)
+        )
+        open(os.path.join(other, "sitecustomize.py"), "w").write(
+            "print 'shadowed'\n"
+        )
+        env = dict(os.environ)
+        env.pop("PRY_COVERAGE", None)
+        env["PYTHONPATH"] = os.pathsep.join([data, other])
+        p = subprocess.Popen(
+            [sys.executable, "-c", "pass"], env=env, cwd=d,
+            stdout=subprocess.PIPE
+        )
+        assert p.communicate()[0] == "shadowed\n"
+
+    def test_afterFork_nocontext(self):
+        c = libpry.coverage.Coverage("testmodule", dummy=True)
+        c.tracing = True
+        c._afterFork()
+        c._finalizer.cancel()
+        assert c.contextNames == []
+        c.dataDir = "nonexistent/dir"
+        c._saveSubprocess()
+
+    def test_contexts(self):
+        c = libpry.coverage.Coverage("testmodule", dummy=True, contexts=True)
+        f = c.fileDict[os.path.abspath("testmodule/test_a.py")]
+        code = compile(open(f.path).read(), f.path, "exec")
+        c.switchContext("one")
+        entry = c._classify(code)
+        assert entry[1] is not f.executed
+        line = min(entry[2])
+        entry[1].add(line)
+        c.switchContext("two")
+        assert not c._codeCache
+        assert not entry[1]
+        assert f.executed == set([line])
+        assert line in c._classify(code)[2]
+        c._classify(code)[1].add(line)
+        c.switchContext(None)
+        c._classify(code)[1].add(line + 1)
+        c.stop()
+        c.switchContext("three")
+        assert f.executed == set([line, line + 1])
+        assert c.whoCovers(f.path, line) == ["one", "two"]
+        assert c.whoCovers(f.path, line + 1) == []
+        assert c.uniqueLines() == []
+
+        self.c.switchContext("one")
+        assert not self.c.contextNames
+
+    def test_diffReport(self):
+        p = os.path.abspath("testmodule/test_a.py")
+        f = self.c.fileDict[p]
+        lines = sorted(f.executable)
+        f.executed = LineSet(lines[:2])
+        changed = {
+            p: LineSet(lines[:4] + [lines[-1] + 10]),
+            os.path.abspath("testmodule/mod_one.py"): LineSet([10000]),
+            "nonexistent": LineSet([1]),
+        }
+        r = self.c.diffReport(changed)
+        assert "test_a.py" in r
+        assert "mod_one.py" not in r
+        assert "[4   ] [2   ] [50.0  %]" in r
+        assert "[%s...%s]"%(lines[2], lines[3]) in r
+        assert "[0   ] [0   ] [100.0 %]" in self.c.diffReport({})
+
     def test_getGlobalStats(self):
         assert self.c.getGlobalStats()
 
@@ -132,7 +583,53 @@ class uCoverage(libpry.AutoTree):
         assert c.getGlobalStats()
 
 
+class uSession(libpry.AutoTree):
+    def setUp(self):
+        self.s = libpry.coverage.Session(dummy=True, contexts=True)
+
+    def test_coverage(self):
+        a = self.s.coverage("testmodule")
+        b = self.s.coverage("testmodule", ["testmodule/two"])
+        assert a.session is self.s
+        assert a.contexts
+        assert a.cache is b.cache is self.s.cache
+        assert a._lineCache is b._lineCache
+        assert len(b.fileDict) < len(a.fileDict)
+        assert self.s.coverage(os.path.abspath("testmodule")) is a
+        assert self.s.coverage("testmodule", ["testmodule/two/"]) is b
+
+    def test_findFiles(self):
+        l = self.s.findFiles("testmodule", [])
+        assert self.s.findFiles("testmodule", []) is l
+        assert self.s.findFiles("testmodule", ["foo"]) is not l
+
+    def test_analysis(self):
+        a = self.s.coverage("testmodule")
+        b = self.s.coverage("testmodule", ["testmodule/two"])
+        p = os.path.abspath("testmodule/test_a.py")
+        a.fileDict[p].analyse()
+        assert b.fileDict[p].fromCache()
+
+    def test_active(self):
+        a = self.s.coverage("testmodule")
+        b = self.s.coverage("testmodule", ["testmodule/two"])
+        a.start()
+        assert self.s.active is a
+        a.start()
+        assert self.s.active is a
+        b.start()
+        assert self.s.active is b
+        a.stop()
+        assert self.s.active is b
+        b.stop()
+        assert self.s.active is None
+
+
 tests = [
+    u_codeLines(),
+    u_codeBranches(),
     uFile(),
+    uAnalysisCache(),
     uCoverage(),
+    uSession(),
 ]
@@ -0,0 +1,107 @@
+import os.path, json, cStringIO, re
+import xml.dom.minidom
+import libpry
+import libpry.coverage
+import libpry.covexport as covexport
+from libpry.lineset import LineSet
+
+
+def write(fn, cov):
+    s = cStringIO.StringIO()
+    fn(cov, s)
+    return s.getvalue()
+
+
+class uExport(libpry.AutoTree):
+    def setUp(self):
+        self.c = libpry.coverage.Coverage("testmodule")
+        self.fname = os.path.abspath("testmodule/test_a.py")
+        self.f = self.c.fileDict[self.fname]
+        self.lines = sorted(self.f.executable)
+        self.f.executed = LineSet(self.lines[:2])
+        self.b = libpry.coverage.Coverage(
+            "covfiles/branches.py", branches=True
+        )
+        f = self.b.fileDict[os.path.abspath("covfiles/branches.py")]
+        f.executed = LineSet([2, 3, 15, 16])
+        f.arcs = set([(2, 3), (15, 16)])
+
+    def test_lcov(self):
+        s = write(covexport.writeLCOV, self.c)
+        assert s.count("end_of_record") == len(self.c.fileDict)
+        assert "BRDA" not in s
+        record = s[s.index("SF:%s\n"%self.fname):].split("end_of_record")[0]
+        assert "DA:%s,1\n"%self.lines[0] in record
+        assert "DA:%s,0\n"%self.lines[2] in record
+        assert "LF:%s\nLH:2\n"%len(self.lines) in record
+
+    def test_lcov_branches(self):
+        s = write(covexport.writeLCOV, self.b)
+        assert "BRDA:2,0,0,1\n" in s
+        assert "BRDA:2,0,1,0\n" in s
+        assert "BRF:4\nBRH:2\n" in s
+
+    def test_cobertura(self):
+        s = write(covexport.writeCobertura, self.c)
+        doc = xml.dom.minidom.parseString(s)
+        root = doc.documentElement
+        total = sum([f.numExecutable for f in self.c.fileDict.values()])
+        assert root.getAttribute("lines-valid") == str(total)
+        assert root.getAttribute("lines-covered") == "2"
+        classes = doc.getElementsByTagName("class")
+        assert len(classes) == len(self.c.fileDict)
+        names = [i.getAttribute("name") for i in
+                    doc.getElementsByTagName("package")]
+        assert "." in names
+        assert len(names) == len(set(names))
+        c = [i for i in classes
+                if i.getAttribute("filename") == "test_a.py"][0]
+        assert len(c.getElementsByTagName("line")) == len(self.lines)
+
+    def test_cobertura_branches(self):
+        s = write(covexport.writeCobertura, self.b)
+        doc = xml.dom.minidom.parseString(s)
+        assert doc.documentElement.getAttribute("branch-rate") == "0.5000"
+        lines = [i for i in doc.getElementsByTagName("line")
+                    if i.getAttribute("branch")]
+        assert len(lines) == 2
+        assert lines[0].getAttribute("condition-coverage") == "50% (1/2)"
+
+    def test_cobertura_empty(self):
+        c = libpry.coverage.Coverage("nonexistent")
+        doc = xml.dom.minidom.parseString(write(covexport.writeCobertura, c))
+        assert doc.documentElement.getAttribute("line-rate") == "1.0"
+        assert not doc.getElementsByTagName("package")
+
+    def test_json(self):
+        d = json.loads(write(covexport.writeJSON, self.c))
+        assert d["root"] == self.c.coveragePath
+        assert len(d["files"]) == len(self.c.fileDict)
+        f = d["files"][self.fname]
+        assert f["executed"] == self.lines[:2]
+        assert f["missing"] == self.lines[2:]
+        stats = self.c.getGlobalStats()
+        assert d["totals"]["statementsRun"] == stats["statementsRun"]
+        assert d["totals"]["allStatements"] == stats["allStatements"]
+        assert "missingBranches" not in f
+
+    def test_json_branches(self):
+        d = json.loads(write(covexport.writeJSON, self.b))
+        f = d["files"][os.path.abspath("covfiles/branches.py")]
+        assert f["missingBranches"] == [[2, 5], [15, -14]]
+        c = libpry.coverage.Coverage("nonexistent")
+        d = json.loads(write(covexport.writeJSON, c))
+        assert d["totals"]["percentage"] == 0
+
+    def test_export(self):
+        p = os.path.join(self.tmpdir(), "out")
+        for fmt in covexport.formats:
+            covexport.export(self.c, fmt, p)
+            s = write(covexport.formats[fmt], self.c)
+            stamp = re.compile('timestamp="\\d+"')
+            assert stamp.sub("", open(p).read()) == stamp.sub("", s)
+
+
+tests = [
+    uExport(),
+]
@@ -0,0 +1,105 @@
+import os.path, json
+import libpry
+import libpry.coverage
+import libpry.covreport as covreport
+from libpry.lineset import LineSet
+
+
+class uReport(libpry.AutoTree):
+    def setUp(self):
+        self.d = os.path.join(self.tmpdir(), "report")
+        self.c = libpry.coverage.Coverage("testmodule")
+        self.fname = os.path.abspath("testmodule/test_a.py")
+        self.f = self.c.fileDict[self.fname]
+        self.lines = sorted(self.f.executable)
+        self.f.executed = LineSet(self.lines[:2])
+
+    def test_annotate(self):
+        r = covreport.Report(self.d, "annotate")
+        written = r.write(self.c)
+        assert len(written) == len(self.c.fileDict)
+        p = os.path.join(self.d, "test_a.py.annotated")
+        assert open(p).read() == self.f.getAnnotation()
+        p = os.path.join(self.d, "two", "test_two.py.annotated")
+        assert os.path.exists(p)
+        assert not os.path.exists(os.path.join(self.d, "index.html"))
+
+    def test_heatmap(self):
+        self.f.hits, self.f.times = {self.lines[0]: 3}, {self.lines[0]: 0.5}
+        r = covreport.Report(self.d, "heatmap")
+        r.write(self.c)
+        p = os.path.join(self.d, "test_a.py.heatmap")
+        assert open(p).read() == self.f.getHeatmap()
+        assert r.write(self.c) == []
+        self.f.hits[self.lines[0]] = 4
+        assert r.write(self.c) == [p]
+
+    def test_incremental(self):
+        covreport.Report(self.d, "annotate").write(self.c)
+        r = covreport.Report(self.d, "annotate")
+        assert r.manifest
+        assert r.write(self.c) == []
+        self.f.executed.add(self.lines[2])
+        p = os.path.join(self.d, "test_a.py.annotated")
+        assert r.write(self.c) == [p]
+        os.remove(p)
+        assert r.write(self.c) == [p]
+        del self.c.fileDict[self.fname]
+        assert r.write(self.c) == []
+        assert not os.path.exists(p)
+        assert "test_a.py.annotated" not in r.manifest
+        # A page already removed by hand.
+        r.manifest["nonexistent"] = "x"
+        r.write(self.c)
+
+    def test_html(self):
+        r = covreport.Report(self.d, "html")
+        r.write(self.c)
+        page = open(os.path.join(self.d, "test_a.py.html")).read()
+        assert page.count('class="run"') == 2
+        assert page.count('class="miss"') == len(self.lines) - 2
+        index = open(os.path.join(self.d, "index.html")).read()
+        assert 'href="test_a.py.html"' in index
+        assert "2 of %s lines run"%len(self.lines) in index
+
+    def test_pool(self):
+        r = covreport.Report(self.d, "annotate")
+        r.minParallel = 1
+        assert len(r.write(self.c, 2)) == len(self.c.fileDict)
+
+    def test_nopool(self):
+        def pool(processes):
+            raise OSError
+        old = covreport.multiprocessing.Pool
+        covreport.multiprocessing.Pool = pool
+        try:
+            r = covreport.Report(self.d, "annotate")
+            r.minParallel = 1
+            assert len(r.write(self.c)) == len(self.c.fileDict)
+        finally:
+            covreport.multiprocessing.Pool = old
+
+    def test_error(self):
+        self.f.path = "nonexistent"
+        r = covreport.Report(self.d, "annotate")
+        written = r.write(self.c)
+        assert len(written) == len(self.c.fileDict) - 1
+        assert "test_a.py.annotated" not in r.manifest
+        job = (
+            "html", "nonexistent", os.path.join(self.d, "x"), "x", 0, 0, {},
+            {}
+        )
+        assert not covreport._writePage(job)
+
+    def test_badmanifest(self):
+        os.mkdir(self.d)
+        open(os.path.join(self.d, ".pryreport"), "w").write("foo")
+        assert covreport.Report(self.d).manifest == {}
+
+    def test_summary(self):
+        assert covreport._summary(0, 0) == "0 of 0 lines run (100.0%)"
+
+
+tests = [
+    uReport(),
+]
@@ -0,0 +1,64 @@
+import os.path, json
+import libpry
+import libpry.coverage
+import libpry.covselect as covselect
+from libpry.lineset import LineSet
+
+
+class uSelect(libpry.AutoTree):
+    def setUp(self):
+        self.c = libpry.coverage.Coverage("testmodule", dummy=True)
+        self.c.contextNames = ["a", "b", "c", "a", "d"]
+        self.one = self.c.fileDict[os.path.abspath("testmodule/test_a.py")]
+        self.two = self.c.fileDict[os.path.abspath("testmodule/mod_one.py")]
+        self.one.contexts = {
+            1: LineSet([0, 1]), 2: LineSet([1, 2]), 3: LineSet([2, 3]),
+        }
+        self.two.contexts = {1: LineSet([0]), 5: LineSet([1])}
+
+    def test_testLines(self):
+        tests = covselect.testLines(self.c)
+        assert sorted(tests) == ["a", "b", "c"]
+        assert len(tests["a"]) == 3
+        assert len(tests["b"]) == 3
+        assert len(tests["c"]) == 2
+        assert len(tests["a"] & tests["c"]) == 1
+        assert covselect.testLines(
+            libpry.coverage.Coverage("nonexistent")
+        ) == {}
+
+    def test_minimize(self):
+        tests = dict(
+            a=LineSet([1, 2, 3, 4]), b=LineSet([1, 2]), c=LineSet([3, 4]),
+            d=LineSet([5]), e=LineSet([4, 5]), f=LineSet(),
+        )
+        assert covselect.minimize(tests) == [("a", 4), ("d", 1)]
+        tests = dict(
+            a=LineSet([1, 2, 3]), b=LineSet([1, 4, 5]), c=LineSet([2, 4, 6]),
+        )
+        assert covselect.minimize(tests) == [("a", 3), ("b", 2), ("c", 1)]
+        assert covselect.minimize({}) == []
+
+    def test_prioritize(self):
+        tests = dict(
+            a=LineSet([1, 2, 3, 4]), b=LineSet([1, 2]), c=LineSet([3]),
+            d=LineSet(), e=LineSet([5]),
+        )
+        times = dict(a=4.0, b=1.0, c=1.0, d=0.5, e=0)
+        assert covselect.prioritize(tests, times) == [
+            ("e", 1), ("b", 2), ("c", 1), ("a", 1), ("d", 0)
+        ]
+        # Without times, each test is assumed to take as long as the others.
+        assert covselect.prioritize(tests, {})[:2] == [("a", 4), ("e", 1)]
+
+    def test_readTimes(self):
+        d = self.tmpdir()
+        p = os.path.join(d, "times")
+        assert covselect.readTimes(p) == {}
+        json.dump(dict(a=1.5), open(p, "w"))
+        assert covselect.readTimes(p) == dict(a=1.5)
+
+
+tests = [
+    uSelect(),
+]
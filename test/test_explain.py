@@ -8,6 +8,84 @@ class uExpression(libpry.AutoTree):
         assert s == "3"
 
 
+class uSaferepr(libpry.AutoTree):
+    def test_bounded(self):
+        assert len(explain.saferepr(range(10**6))) < 200
+        assert len(explain.saferepr(dict.fromkeys(range(10**5)))) < 200
+        assert len(explain.saferepr(set(range(10**5)))) < 200
+        assert len(explain.saferepr(frozenset(range(10**5)))) < 200
+        assert len(explain.saferepr(u"a"*10**6)) < 200
+        assert explain.saferepr(u"a") == "u'a'"
+        assert explain.saferepr({}) == "{}"
+        assert explain.saferepr([[[[{1: 2}]]]]) == "[[[[{...}]]]]"
+
+    def test_subclass(self):
+        class L(list): pass
+        class R(list):
+            def __repr__(self):
+                return "R"
+        assert len(explain.saferepr(L(range(10**5)))) < 200
+        assert explain.saferepr(R()) == "R"
+
+    def test_error(self):
+        class Bad(object):
+            def __repr__(self):
+                raise ValueError
+        assert "unrepresentable" in explain.saferepr(Bad())
+
+
+class uDiff(libpry.AutoTree):
+    def test_strings(self):
+        l = explain.diff("abc\ndef", "abc\ndxf")
+        assert "index 5 (line 2, column 1)" in l[0]
+        l = explain.diff("a"*10000, "a"*10001)
+        assert l[0] == "lengths differ: 10000 != 10001"
+        assert "index 10000" in l[1]
+
+    def test_sequences(self):
+        l = explain.diff(range(100), range(50) + [0]*50)
+        assert l[0] == "first differing items:"
+        assert l[1] == "  [50]: 50 != 0"
+        assert l[-1] == "50 differing items"
+        assert len(l) == 7
+        l = explain.diff([1], [1, 2])
+        assert l == ["lengths differ: 1 != 2"]
+
+    def test_sets(self):
+        l = explain.diff(set([1, 2]), frozenset([2, 3]))
+        assert l == [
+            "only on left: 1", "1 differing items only on left",
+            "only on right: 3", "1 differing items only on right"
+        ]
+
+    def test_dicts(self):
+        l = explain.diff(dict(a=1, b=2), dict(a=2, b=2, c=3))
+        assert "lengths differ: 2 != 3" in l
+        assert "only on right: 'c'" in l
+        assert "  ['a']: 1 != 2" in l
+
+    def test_budget(self):
+        d = explain._Differ(range(20), [0]*20)
+        d.budget = 10
+        assert "stopped after 10" in d.lines()[-1]
+        d = explain._Differ(set(range(20)), set())
+        d.budget = 10
+        assert "stopped after 10" in d.lines()[-1]
+        d = explain._Differ(dict.fromkeys(range(20), 1), dict.fromkeys(range(20)))
+        d.budget = 10
+        assert "stopped after 10" in d.lines()[-1]
+        d = explain._Differ("a"*10000, "a"*10000 + "b")
+        d.budget = 5000
+        assert "no difference in first 5000" in d.lines()[-1]
+
+    def test_other(self):
+        assert explain.diff(1, 2) == []
+        class Bad(object):
+            def __ne__(self, other):
+                raise ValueError
+        assert explain.diff([Bad()], [1]) == []
+
+
 class uExplain(libpry.AutoTree):
     def setUp(self):
         self.s = explain.Explain()
@@ -97,8 +175,26 @@ class uExplain(libpry.AutoTree):
             )
         assert "1 == 2 and 3 == 4" in str(r)
 
+    def test_str_diff(self):
+        r = explain.Explain("a == b", dict(a=[1, 2], b=[1, 3]), dict())
+        assert "[1]: 2 != 3" in str(r)
+
+
+class uCaptured(libpry.AutoTree):
+    def test_str(self):
+        r = explain.Captured("a == b, foo", ["1", "==", "2"])
+        assert r.expr == "a == b"
+        assert "1 == 2" in str(r)
+        r = explain.Captured("a == (b", ["1"])
+        assert r.expr == "a == (b"
+        r = explain.Captured("a == b", ["1", "==", "2"], [("ab", "ac")])
+        assert "index 1" in str(r)
+
 
 tests = [
+    uSaferepr(),
+    uDiff(),
     uExpression(),
-    uExplain()
+    uExplain(),
+    uCaptured()
 ]
@@ -0,0 +1,82 @@
+import os.path, subprocess
+import libpry
+import libpry.gitdiff as gitdiff
+
+DIFF = """\
+diff --git a/one.py b/one.py
+index 1111111..2222222 100644
+--- a/one.py
++++ b/one.py
+@@ -1,0 +2,2 @@ def f():
++    a = 1
++    b = 2
+@@ -10 +12 @@ def g():
+-    c = 3
++    c = 4
+@@ -20,2 +21,0 @@ def h():
+-    d = 5
+-    e = 6
+diff --git a/gone.py b/gone.py
+deleted file mode 100644
+--- a/gone.py
++++ /dev/null
+@@ -1 +0,0 @@
+-x = 1
+diff --git a/new file.py b/new file.py
+new file mode 100644
+--- /dev/null
++++ b/new file.py\t
+@@ -0,0 +1 @@
++y = 1
+"""
+
+
+class uParse(libpry.AutoTree):
+    def test_parse(self):
+        c = gitdiff.parse(DIFF, "/repo")
+        assert c == {
+            "/repo/one.py": set([2, 3, 12]),
+            "/repo/new file.py": set([1]),
+        }
+
+    def test_empty(self):
+        assert gitdiff.parse("", "/repo") == {}
+
+
+class uChangedLines(libpry.AutoTree):
+    def git(self, *args):
+        subprocess.check_call(
+            ("git", "-c", "user.name=pry", "-c", "user.email=pry@example.com")
+            + args,
+            cwd=self.d,
+            stdout=open(os.devnull, "w")
+        )
+
+    def setUp(self):
+        self.d = os.path.realpath(self.tmpdir())
+        self.git("init", "-q")
+        open(os.path.join(self.d, "a.py"), "w").write("a = 1\nb = 2\n")
+        self.git("add", "a.py")
+        self.git("commit", "-q", "-m", "one")
+
+    def test_changedLines(self):
+        open(os.path.join(self.d, "a.py"), "w").write("a = 1\nb = 3\nc = 4\n")
+        c = gitdiff.changedLines("HEAD", self.d)
+        assert c == {os.path.join(self.d, "a.py"): set([2, 3])}
+
+    def test_error(self):
+        libpry.raises(
+            "git diff failed", gitdiff.changedLines, "nonexistent", self.d
+        )
+        path = os.environ["PATH"]
+        os.environ["PATH"] = ""
+        try:
+            libpry.raises("could not run git", gitdiff.changedLines, "HEAD")
+        finally:
+            os.environ["PATH"] = path
+
+
+tests = [
+    uParse(),
+    uChangedLines(),
+]
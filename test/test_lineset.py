@@ -0,0 +1,68 @@
+import libpry
+from libpry.lineset import LineSet
+
+
+class uLineSet(libpry.AutoTree):
+    def test_basic(self):
+        s = LineSet([3, 1, 200])
+        assert list(s) == [1, 3, 200]
+        assert len(s) == 3
+        assert 200 in s
+        assert not 2 in s
+        assert s
+        assert not LineSet()
+        s.add(5)
+        s.discard(1)
+        s.discard(7)
+        assert s == set([3, 5, 200])
+        assert s != set([3])
+        assert repr(s) == "LineSet([3, 5, 200])"
+        c = s.copy()
+        c.update([9])
+        assert 9 not in s
+        assert c.pop() == 3
+        assert c == [5, 9, 200]
+        libpry.raises(KeyError, LineSet().pop)
+
+    def test_init(self):
+        bits = 1 | 1 << 7 | 1 << 8 | 1 << 1000
+        assert LineSet([0, 7, 8, 8, 1000]).bits == bits
+        assert LineSet(iter([3]), bits=1) == [0, 3]
+        assert LineSet(xrange(0, 100000, 7)) == set(xrange(0, 100000, 7))
+        libpry.raises(ValueError, LineSet, [1, -1])
+        assert LineSet([64, 65]).pop() == 64
+
+    def test_operators(self):
+        a, b = LineSet([1, 2, 3]), LineSet([3, 4])
+        assert a | b == set([1, 2, 3, 4])
+        assert a & b == set([3])
+        assert a - b == set([1, 2])
+        assert set([1, 2, 3]) | b == set([1, 2, 3, 4])
+        assert set([1, 3]) & a == set([1, 3])
+        assert set([3, 9]) - b == set([9])
+        assert LineSet([1]) <= a
+        assert not a <= b
+        assert a >= set([2])
+        assert not b >= a
+        a |= [10]
+        assert 10 in a
+
+    def test_eq(self):
+        assert LineSet([1]) == LineSet([1])
+        assert LineSet([1]) != LineSet([2])
+        assert not LineSet([1]) == None
+        assert LineSet([1]) != None
+        assert not LineSet([1]) == ["a"]
+
+    def test_bytes(self):
+        for i in [[], [0], [1, 7, 8, 9, 300], range(0, 1000, 3)]:
+            s = LineSet(i)
+            assert LineSet.frombytes(s.tobytes()) == s
+        assert LineSet().tobytes() == ""
+        assert LineSet([0, 9]).tobytes() == "\x01\x02"
+        assert len(LineSet([800]).tobytes()) == 101
+
+
+tests = [
+    uLineSet(),
+]
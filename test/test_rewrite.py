@@ -0,0 +1,145 @@
+import os.path, sys
+import libpry
+import libpry.rewrite as rewrite
+
+
+def run(src, **ns):
+    """
+        Execute rewritten source, and return the captured values of the
+        resulting assertion failure.
+    """
+    code = rewrite.rewrite(src, "<test>")
+    try:
+        exec code in ns
+    except AssertionError, v:
+        return " ".join(v._pryCaptured)
+    raise ValueError("No assertion failure.")
+
+
+class uRewrite(libpry.AutoTree):
+    def test_pass(self):
+        code = rewrite.rewrite("assert a == 1 and not b", "<test>")
+        exec code in dict(a=1, b=0)
+
+    def test_compare(self):
+        assert run("assert a == b", a=1, b=2) == "1 == 2"
+        assert run("assert a in b", a=1, b=[2]) == "1 in [2]"
+        assert run("assert a is not b", a=None, b=None) == "None is not None"
+
+    def test_diffs(self):
+        code = rewrite.rewrite("assert a == 1 == b", "<test>")
+        try:
+            exec code in dict(a=1, b=2)
+        except AssertionError, v:
+            assert v._pryDiffs == [(1, 2)]
+
+    def test_bounded(self):
+        s = run("assert a == b", a=range(10**5), b=[])
+        assert len(s) < 400
+
+    def test_chained(self):
+        assert run("assert 1 < a < 3", a=4) == "1 < 4 < 3"
+        assert run("assert 1 < a < 3", a=0) == "1 < 0 < ..."
+
+    def test_bool(self):
+        assert run("assert a and b", a=0, b=1) == "0 and ..."
+        assert run("assert a and b", a=1, b=0) == "1 and 0"
+        assert run("assert a or b", a=0, b=0) == "0 or 0"
+        assert run("assert a == 1 or b", a=0, b=0) == "(0 == 1) or 0"
+
+    def test_nested_bool(self):
+        s = run("assert (a and b) or c", a=0, b=1, c=0)
+        assert s == "(0 and ...) or 0"
+        s = run("assert (a or b) and c", a=0, b=1, c=0)
+        assert s == "(0 or 1) and 0"
+        s = run("assert (a or b) and c", a=0, b=0, c=0)
+        assert s == "(0 or 0) and ..."
+        s = run("assert (a < b < c) and d", a=1, b=2, c=0, d=1)
+        assert s == "(1 < 2 < 0) and ..."
+        s = run("assert not a and b", a=0, b=0)
+        assert s == "(not 0) and 0"
+
+    def test_not(self):
+        assert run("assert not a", a=1) == "not 1"
+        assert run("assert not (a != 1)", a=2) == "not (2 != 1)"
+        assert run("assert not not a", a=0) == "not (not 0)"
+
+    def test_side_effects(self):
+        calls = []
+        def f():
+            calls.append(1)
+            return len(calls)
+        assert run("assert f() == 2", f=f) == "1 == 2"
+        assert len(calls) == 1
+
+    def test_msg(self):
+        code = rewrite.rewrite("assert a, 'msg %s'%a", "<test>")
+        try:
+            exec code in dict(a=0)
+        except AssertionError, v:
+            assert str(v) == "msg 0"
+            assert v._pryCaptured == ["0"]
+
+    def test_function(self):
+        src = "def f(a):\n    for i in range(a):\n        assert i < 2\nf(5)"
+        assert run(src) == "2 < 2"
+
+    def test_header(self):
+        src = '"""Doc."""\nfrom __future__ import division\nassert a/2 == 1'
+        assert run(src, a=1) == "0.5 == 1"
+
+    def test_badrepr(self):
+        class Bad(object):
+            def __repr__(self):
+                raise ValueError
+        assert "unrepresentable" in run("assert a == 1", a=Bad())
+
+    def test_render_error(self):
+        class Once(object):
+            calls = 0
+            def __nonzero__(self):
+                self.calls += 1
+                if self.calls > 2:
+                    raise ValueError
+                return False
+        code = rewrite.rewrite("assert a and b", "<test>")
+        try:
+            exec code in dict(a=Once(), b=1)
+        except AssertionError, v:
+            assert v._pryCaptured is None
+
+
+class uAssertionImporter(libpry.AutoTree):
+    def setUp(self):
+        self.d = self.tmpdir()
+        self.path = os.path.join(self.d, "rewritten.py")
+        f = open(self.path, "w")
+        f.write("def f(a):\n    assert a == 2\n")
+        f.close()
+        self.i = rewrite.AssertionImporter()
+        self.i.register("rewritten", self.path)
+
+    def tearDown(self):
+        sys.meta_path.remove(self.i)
+        sys.modules.pop("rewritten", None)
+
+    def test_import(self):
+        m = __import__("rewritten")
+        assert m.__loader__ is self.i
+        libpry.raises(AssertionError, m.f, 1)
+        assert reload(m) is m
+        assert self.i.find_module("rewritten", ["foo"]) is None
+        assert self.i.find_module("nonexistent") is None
+
+    def test_error(self):
+        f = open(self.path, "w")
+        f.write("raise ValueError")
+        f.close()
+        libpry.raises(ValueError, __import__, "rewritten")
+        assert "rewritten" not in sys.modules
+
+
+tests = [
+    uRewrite(),
+    uAssertionImporter(),
+]
@@ -1,4 +1,5 @@
-import fnmatch, cStringIO, os, shutil
+import fnmatch, cStringIO, os, shutil, json
+import xml.dom.minidom
 import libpry.test
 
 zero = libpry.test._Output(libpry.test._RootNode(False, None), 0)
@@ -429,6 +430,10 @@ class u_DirNode(libpry.test.AutoTree):
         d = libpry.test._DirNode("testmodule/nocover", True)
         assert d.coverage == False
 
+    def test_cover(self):
+        d = libpry.test._DirNode("testmodule", libpry.test._DUMMY)
+        assert d.coverage.session.dummy
+
     def test_run(self):
         self.d._run(zero, 1, None)
 
@@ -450,6 +455,82 @@ class u_RootNode(libpry.test.AutoTree):
         assert not r.search(os.path.join("testmodule", "two", "test_two"))
         assert r.search("test_one")
 
+    def test_saveCoverage(self):
+        d = self.tmpdir()
+        p = os.path.join(d, "data")
+        self["root"].saveCoverage(p)
+        assert not os.path.exists(p)
+        self["coverageRoot"].saveCoverage(p)
+        c = libpry.covdata.read(p)
+        assert c.coveragePath == os.path.abspath("..")
+        assert c.fileDict
+
+    def test_contexts(self):
+        r = libpry.test._RootNode(
+            libpry.test._DUMMY, None, dict(contexts=True)
+        )
+        r.addPath("testmodule", False)
+        r._run(zero, 1)
+        names = r.children[0].coverage.contextNames
+        ran = [i.fullPath() for i in r.tests() if filter(None, i._states())]
+        assert names == ran
+
+    def test_session(self):
+        r = libpry.test._RootNode(libpry.test._DUMMY, None)
+        r.addPath("testmodule", False)
+        r.addPath("testmodule", False)
+        a, b = r.children[0].coverage, r.children[1].coverage
+        assert a is b
+        assert a.session is r.session
+        assert a.cache is r.analysisCache
+        assert sorted(r.mergedCoverage().fileDict) == sorted(a.fileDict)
+        r._run(zero, 1)
+        s = cStringIO.StringIO()
+        libpry.test._Output(r, 1, s).final(r)
+        assert s.getvalue().count("> testmodule") == 1
+        assert not libpry.test._RootNode(False, None).session
+
+    def test_changedLines(self):
+        r = libpry.test._RootNode(libpry.test._DUMMY, None)
+        r.addPath("testmodule", False)
+        r.changedLines = {}
+        r._run(zero, 1)
+        s = cStringIO.StringIO()
+        libpry.test._Output(r, 1, s).final(r)
+        assert "[0   ] [0   ] [100.0 %]" in s.getvalue()
+
+    def test_functions(self):
+        r = libpry.test._RootNode(
+            libpry.test._DUMMY, None, dict(functions=True)
+        )
+        r.addPath("testmodule", False)
+        r._run(zero, 1)
+        s = cStringIO.StringIO()
+        libpry.test._Output(r, 1, s).final(r)
+        assert "] [0   ] [0.0   %]\n" in s.getvalue()
+
+    def test_hits(self):
+        r = libpry.test._RootNode(libpry.test._DUMMY, None, dict(hits=True))
+        r.addPath("testmodule", False)
+        r._run(zero, 1)
+        s = cStringIO.StringIO()
+        libpry.test._Output(r, 1, s).final(r)
+        assert "Hottest lines:" in s.getvalue()
+
+    def test_saveAnalysis(self):
+        d = self.tmpdir()
+        old = libpry.test._RootNode.analysisFile
+        libpry.test._RootNode.analysisFile = os.path.join(d, "cache")
+        try:
+            r = libpry.test._RootNode(libpry.test._DUMMY, None)
+        finally:
+            libpry.test._RootNode.analysisFile = old
+        r.addPath("testmodule", False)
+        assert r.children[0].coverage.coverageReport()
+        r.saveAnalysis()
+        assert os.path.exists(os.path.join(d, "cache"))
+        libpry.test._RootNode(False, None).saveAnalysis()
+
     def test_errFinal(self):
         try:
             raise ValueError
@@ -512,7 +593,161 @@ class uOutput(libpry.test.AutoTree):
         self.output.final(self["coverageRoot"])
         self.output.final(self["profileRoot"])
 
-    
+
+
+class uMachineOutput(libpry.test.AutoTree):
+    def _report(self, root, klass):
+        s = cStringIO.StringIO()
+        o = libpry.test._Output(root, 1, s, klass)
+        root._run(o, 1)
+        o.final(root)
+        return s.getvalue()
+
+    def test_junit(self):
+        s = self._report(self["profileRoot"], libpry.test._OutputJUnit)
+        d = xml.dom.minidom.parseString(s)
+        cases = d.getElementsByTagName("testcase")
+        assert len(cases) > len(self["profileRoot"].tests())
+        assert d.getElementsByTagName("failure")
+        assert d.getElementsByTagName("error")
+        assert d.getElementsByTagName("skipped")
+        assert d.getElementsByTagName("system-out")
+        total = 0
+        for suite in d.getElementsByTagName("testsuite"):
+            cases = suite.getElementsByTagName("testcase")
+            total += len(cases)
+            for i in cases:
+                name = i.getAttribute("classname") or "pry"
+                assert name == suite.getAttribute("name")
+        assert total == len(d.getElementsByTagName("testcase"))
+
+    def test_junit_stream(self):
+        r = libpry.test._RootNode(False, None)
+        r.addChild(TTree())
+        r._run(zero, 1)
+        o = libpry.test._OutputJUnit(r)
+        tests = r.search("test_pass")
+        s = o.nodePass(tests[0])
+        assert s.startswith("<?xml")
+        assert "<testsuite name=" in s and "<testcase" in s
+        s = o.nodePass(tests[0])
+        assert s.startswith("<testcase")
+        assert o.nodePost(r) is None
+        assert o.nodePost(tests[0].parent) == "</testsuite>\n"
+        assert o.final(r).endswith("</testsuites>\n")
+
+    def test_json(self):
+        s = self._report(self["profileRoot"], libpry.test._OutputJSON)
+        events = [json.loads(i) for i in s.splitlines()]
+        assert events[0] == dict(
+            event="start", tests=len(self["profileRoot"].tests())
+        )
+        kinds = set([i["event"] for i in events])
+        assert kinds == set(["start", "pass", "fail", "fixture-error", "skip",
+                             "final"])
+        assert events[-1]["failed"] == len(self["profileRoot"].allErrors())
+        assert [i for i in events if i.get("profile")]
+        for i in events:
+            if i["event"] in ("pass", "fail", "fixture-error"):
+                assert i["time"] >= 0
+
+    def test_internal_error(self):
+        try:
+            raise ValueError
+        except:
+            pass
+        r = libpry.test._RootNode(False, None)
+        r.goState = libpry.test._Error(r, "")
+        for k in libpry.test._OutputJUnit, libpry.test._OutputJSON:
+            assert "ValueError" in k(r).final(r)
+
+    def test_tee(self):
+        a, b = cStringIO.StringIO(), cStringIO.StringIO()
+        r = libpry.test._RootNode(False, None)
+        r.addChild(TTree())
+        r._run(zero, 1)
+        o = libpry.test._Tee(
+            libpry.test._Output(r, 1, a),
+            libpry.test._Output(r, 1, b, libpry.test._OutputJSON),
+        )
+        o.nodeError(r.search("test_fail")[0])
+        assert a.getvalue() == "E"
+        assert not b.getvalue()
+        o.final(r)
+        assert "start" in b.getvalue()
+
+
+class uOutputProgress(libpry.test.AutoTree):
+    def setUp(self):
+        self.d = self.tmpdir()
+        self.old = libpry.test._OutputProgress.historyFile
+        libpry.test._OutputProgress.historyFile = os.path.join(self.d, "t")
+
+    def tearDown(self):
+        libpry.test._OutputProgress.historyFile = self.old
+
+    def test_run(self):
+        r = self["profileRoot"]
+        o = libpry.test._OutputProgress(r)
+        assert o.eta() is None
+        o.redrawInterval = 0
+        r._run(o, 1)
+        assert o.done
+        assert o.eta() is not None
+        s = o.final(r)
+        assert s.startswith("\r[")
+
+        o = libpry.test._OutputProgress(r)
+        assert o.history
+        assert o.eta() > 0
+        assert o.unknown < len(r.tests())
+        o.redrawInterval = 1000
+        assert o.nodePre(r.tests()[0]) is None
+        r._run(o, 1)
+
+    def test_estimate(self):
+        r = self["profileRoot"]
+        o = libpry.test._OutputProgress(r)
+        r._run(o, 3)
+        o.final(r)
+        assert o.done < o.total
+        # Tests that can't run because of fixture errors are accounted for.
+        assert o.known == 0 and o.unknown == 0
+        t = r.allPassed()[0]
+        assert o.history[t.fullPath()] == t.callState.time/3
+        o = libpry.test._OutputProgress(r)
+        base = o.eta()
+        r.repeat = 1
+        assert abs(o.eta()*3 - base) < 0.01
+        o.nodePre(t)
+        o.currentStart -= 1000
+        assert o.eta() < base
+
+    def test_tick(self):
+        s = cStringIO.StringIO()
+        r = self["root"]
+        out = libpry.test._Output(r, 1, s, libpry.test._OutputProgress)
+        assert out.lock
+        out._tick()
+        assert s.getvalue().startswith("\r[")
+        out.nodePre(r.tests()[0])
+        out.final(r)
+        assert out._ticking.isSet()
+        n = len(s.getvalue())
+        out._tick()
+        assert len(s.getvalue()) == n
+        assert libpry.test._OutputZero(r).tick() is None
+
+    def test_badhistory(self):
+        f = open(libpry.test._OutputProgress.historyFile, "w")
+        f.write("not json")
+        f.close()
+        o = libpry.test._OutputProgress(self["root"])
+        assert o.history == {}
+        o.historyPath = os.path.join(self.d, "nonexistent", "t")
+        o._save()
+
+
 class uTest(libpry.test.AutoTree):
     def test_run_error(self):
         t = TTree()
@@ -529,6 +764,29 @@ class uTest(libpry.test.AutoTree):
         t = libpry.test.Test("name")
         libpry.test.raises(NotImplementedError, t)
 
+    def test_explain(self):
+        # Assertions raised outside rewritten modules are re-evaluated.
+        try:
+            libpry.test.raises(ValueError, ok)
+        except AssertionError:
+            e = libpry.test._Error(None, None)
+        assert "Re-evaluating" in e.explanation
+
+
+class _FlushCounter:
+    def __init__(self):
+        self.s = cStringIO.StringIO()
+        self.flushes = 0
+
+    def write(self, s):
+        self.s.write(s)
+
+    def flush(self):
+        self.flushes += 1
+
+    def getvalue(self):
+        return self.s.getvalue()
+
 
 class u_Output(libpry.test.AutoTree):
     def test_construct(self):
@@ -548,6 +806,62 @@ class u_Output(libpry.test.AutoTree):
         o = libpry.test._Output(r, 999)
         assert isinstance(o.o, libpry.test._OutputThree)
 
+    def test_buffer(self):
+        fp = _FlushCounter()
+        t = TTree()
+        o = libpry.test._Output(t, 1, fp)
+        o.flushInterval = 1000
+        o.nodePass(t.search("test_pass")[0])
+        assert fp.flushes == 0
+        assert o.buf == ["."]
+        o.nodeError(t.search("test_fail")[0])
+        assert fp.flushes == 1
+        assert fp.getvalue() == ".E"
+        o.flushSize = 1
+        o.nodePass(t.search("test_pass")[0])
+        assert fp.flushes == 2
+        o.nodePost(t)
+        assert fp.flushes == 2
+
+    def test_flushPre(self):
+        fp = _FlushCounter()
+        t = TTree()
+        o = libpry.test._Output(t, 1, fp)
+        o.flushInterval = 1000
+        o.nodePass(t.search("test_pass")[0])
+        assert fp.flushes == 0
+        # Output that isn't stale yet is kept.
+        o.nodePre(t.search("test_fail")[0])
+        assert fp.flushes == 0
+        # Starting a container doesn't flush, starting a test does.
+        o.flushInterval = 0
+        o.nodePre(t)
+        assert fp.flushes == 0
+        o.nodePre(t.search("test_fail")[0])
+        assert fp.flushes == 1
+        assert fp.getvalue() == "."
+        # Nothing buffered, nothing to flush.
+        o.nodePre(t.search("test_fail")[0])
+        assert fp.flushes == 1
+
+    def test_flushMany(self):
+        t = libpry.test.TestContainer(name="many")
+        for i in range(1000):
+            t.addChild(libpry.test.CallableNode("test_%s"%i, ok))
+        for verbosity in (1, 2):
+            fp = _FlushCounter()
+            o = libpry.test._Output(t, verbosity, fp)
+            o.flushInterval = 1000
+            t._run(o, 1, None)
+            o.flush()
+            assert fp.flushes < 10
+
+    def test_nofp(self):
+        t = TTree()
+        o = libpry.test._Output(t, 1, None)
+        o.nodeError(t)
+        assert not o.buf
+
 
 
 class u_FileNode(libpry.test.AutoTree):
@@ -571,6 +885,10 @@ tests = [
         uOutput(libpry.test._OutputOne),
         uOutput(libpry.test._OutputTwo),
         uOutput(libpry.test._OutputThree),
+        uOutput(libpry.test._OutputJUnit),
+        uOutput(libpry.test._OutputJSON),
+        uMachineOutput(),
+        uOutputProgress(),
         u_FileNode(),
         u_RootNode(),
         u_DirNode(),
@@ -1,3 +1,4 @@
+import os.path
 import libpry
 
 
@@ -15,6 +16,51 @@ class uisPathContained(libpry.AutoTree):
         assert not libpry.utils.isPathContainedAny([".", "flibble"], "..")
 
 
+class uPathMatcher(libpry.AutoTree):
+    def test_match(self):
+        m = libpry.utils.PathMatcher(
+            ["foo", "bar/baz.py", "*/gen_*.py", "a/**/b", "a/**/c/*.py"]
+        )
+        assert m.match("foo")
+        assert m.match("foo/x/y.py")
+        assert not m.match("foobar")
+        assert m.match("bar/baz.py")
+        assert not m.match("bar/qux.py")
+        assert m.match("x/gen_one.py")
+        assert not m.match("x/y/gen_one.py")
+        assert m.match("a/b/x.py")
+        assert m.match("a/x/y/b")
+        assert m.match("a/c/x.py")
+        assert m.match("a/x/c/x.py")
+        assert not m.match("a/c/x.txt")
+        assert not m.match("a/x")
+        assert not libpry.utils.PathMatcher([]).match(".")
+        assert libpry.utils.PathMatcher(["."]).match("foo")
+        # Patterns sharing a glob component share a node.
+        m = libpry.utils.PathMatcher(["*/a", "*/b", "*/**/c", "*/**/d"])
+        assert len(m._start(".")[0].globs) == 1
+        assert m.match("x/b") and m.match("x/y/d")
+
+    def test_walk(self):
+        d = self.tmpdir()
+        for i in ("a/x.py", "a/gen_x.py", "b/y.py", "c/d/z.py"):
+            p = os.path.join(d, i)
+            if not os.path.isdir(os.path.dirname(p)):
+                os.makedirs(os.path.dirname(p))
+            open(p, "w").close()
+        m = libpry.utils.PathMatcher(
+            [os.path.join(d, "b"), os.path.join(d, "*", "gen_*")]
+        )
+        l = []
+        for root, dirs, files in m.walk(d):
+            assert "b" not in dirs
+            l.extend([os.path.join(root, f) for f in files])
+        assert sorted(l) == [
+            os.path.join(d, "a", "x.py"), os.path.join(d, "c", "d", "z.py")
+        ]
+        assert not list(m.walk(os.path.join(d, "b")))
+
+
 class usummariseList(libpry.AutoTree):
     def test_summariseList(self):
         lst = [1, 2, 3, 4, 5]
@@ -94,6 +140,7 @@ tests = [
     uisNumeric(),
     u_splitSpec(),
     uisPathContained(),
+    uPathMatcher(),
     usummariseList(),
     u_terminalWidth()
 ]